@@ -0,0 +1,126 @@
+# Solve a whole stack of maps at once with a vectorized Breadth First Search
+import numpy
+
+from MapSearchNoGUI import generate_walls
+
+CHUNK_SIZE = 4096
+
+
+def random_maps(number, size, probability, seed=None):
+    """
+    Generate a stack of maps the same way Map does, one after the other from the same generator
+    :param number: number of maps
+    :param size: size of each map
+    :param probability: 0.0 - 1.0 (0: all empty cells, 1: all walls)
+    :param seed: seed of the random generator
+    :return: (number x size x size) uint8 array, 1 for walls, start and finish are always empty
+             (random_maps(1, size, probability, seed)[0] is the matrix of Map(size, probability, seed=seed))
+    """
+    if probability > 1 or probability < 0:
+        raise ValueError("probability is in range 0 and 1")
+
+    maps = numpy.empty((number, size, size), dtype=numpy.uint8)
+    generate_walls(maps.reshape(number * size, size), probability, numpy.random.default_rng(seed))
+    maps[:, 0, 0] = maps[:, size - 1, size - 1] = 0
+    return maps
+
+
+def map_bits(words, number):
+    """
+    Indices of the maps whose bit is set
+    :param words: uint64 array, bit k % 64 of words[k // 64] belongs to map k
+    :param number: number of maps
+    :return: array of map indices
+    """
+    bits = numpy.unpackbits(words.view(numpy.uint8), bitorder="little")[:number]
+    return numpy.flatnonzero(bits)
+
+
+def solve_chunk(open_cells):
+    """
+    Breadth First Search from (0, 0) to (size - 1, size - 1) on every map of the chunk, one wavefront per step
+    The maps are bit-packed along the map axis: cell (x, y) of map k is bit k % 64 of word [x, y, k // 64], so a
+    wavefront step is a few bitwise operations on (size x size x words) arrays. Finished maps are masked out.
+    :param open_cells: (n x size x size) boolean array, True for empty cells
+    :return: path length (-1 if there is no path) and number of visited cells of each map
+    """
+    (number, size) = open_cells.shape[:2]
+    words = (number + 63) // 64
+    packed = numpy.zeros((size, size, words * 8), dtype=numpy.uint8)
+    packed[:, :, :(number + 7) // 8] = numpy.packbits(numpy.moveaxis(open_cells, 0, -1), axis=-1, bitorder="little")
+    open_bits = packed.view(numpy.uint64)
+
+    running = numpy.zeros(words * 8, dtype=numpy.uint8)
+    running[:(number + 7) // 8] = numpy.packbits(numpy.ones(number, dtype=bool), bitorder="little")
+    running = running.view(numpy.uint64)
+
+    path_length = numpy.full(number, -1, dtype=numpy.int64)
+    # Empty cells not reached yet, the wavefront is always a subset of them
+    unreached = open_bits.copy()
+    unreached[0, 0] = 0
+    wavefront = numpy.zeros_like(open_bits)
+    wavefront[0, 0] = running
+    grown = numpy.empty_like(open_bits)
+    distance = 0
+    # On a 1 x 1 map the start is the finish
+    found = wavefront[-1, -1] & running
+    path_length[map_bits(found, number)] = 0
+    running &= ~found
+
+    while running.any():
+        distance += 1
+        # Move the wavefront one cell in every direction
+        grown[:] = 0
+        grown[:, 1:] |= wavefront[:, :-1]
+        grown[1:, :] |= wavefront[:-1, :]
+        grown[:, :-1] |= wavefront[:, 1:]
+        grown[:-1, :] |= wavefront[1:, :]
+        grown &= unreached
+        unreached ^= grown
+        (wavefront, grown) = (grown, wavefront)
+
+        # A map is finished when the wavefront reaches the finish or dies out
+        found = wavefront[-1, -1] & running
+        alive = numpy.bitwise_or.reduce(wavefront.reshape(-1, words), axis=0)
+        finished = (found | ~alive) & running
+        if finished.any():
+            path_length[map_bits(found, number)] = distance - 1
+            running &= ~finished
+            wavefront &= running
+
+    # Visited cells are the empty cells that are not unreached, counted one row at a time
+    visited_cells = numpy.zeros(words * 64, dtype=numpy.int64)
+    for row in open_bits & ~unreached:
+        visited_cells += numpy.unpackbits(row.view(numpy.uint8), axis=-1,
+                                          bitorder="little").sum(axis=0, dtype=numpy.int64)
+    return path_length, visited_cells[:number]
+
+
+def batch_bfs(maps, chunk_size=CHUNK_SIZE):
+    """
+    Find the shortest path of every map in a stack, in one vectorized pass per chunk of maps
+    Path length counts the cells between start and finish like FindSolution does. Visited cells are the cells
+    reached by the wavefront when it reaches the finish (every reachable cell when there is no path).
+    :param maps: (N x size x size) array, 0 for empty cells (or a list of Map objects)
+    :param chunk_size: number of maps solved together, bounds the memory to a few chunk_size * size * size bits
+    :return: dictionary of "Solvable", "Path length" (-1 if there is no path) and "No of visited cells" arrays
+    """
+    if isinstance(maps, list):
+        maps = numpy.stack([a_map.map for a_map in maps])
+
+    path_length = numpy.empty(len(maps), dtype=numpy.int64)
+    visited_cells = numpy.empty(len(maps), dtype=numpy.int64)
+    for first in range(0, len(maps), chunk_size):
+        chunk = slice(first, first + chunk_size)
+        (path_length[chunk], visited_cells[chunk]) = solve_chunk(numpy.asarray(maps[chunk]) == 0)
+
+    return {"Solvable": path_length >= 0, "Path length": path_length, "No of visited cells": visited_cells}
+
+
+if __name__ == "__main__":
+    # Density sweep of Question 8, with 10000 maps per density instead of 100
+    for p in numpy.arange(0.1, 0.44, 0.05):
+        result = batch_bfs(random_maps(10000, 100, p, seed=int(p * 100)))
+        solvable = result["Solvable"]
+        print("p = %.2f  solvable: %.4f  path length: %.1f  visited cells: %.1f"
+              % (p, solvable.mean(), result["Path length"][solvable].mean(), result["No of visited cells"].mean()))
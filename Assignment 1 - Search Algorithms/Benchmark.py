@@ -0,0 +1,191 @@
+# Reproducible benchmark of the FindSolution solvers on seeded maps, compared against a stored baseline
+import argparse
+import json
+import multiprocessing
+import platform
+import statistics
+import sys
+import time
+
+import numpy
+
+from MapSearchNoGUI import Map, FindSolution, HEURISTICS
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then not recorded
+    resource = None
+
+SIZES = [100, 500, 1000, 2000, 5000]
+PROBABILITIES = [0.1, 0.2, 0.3, 0.4]
+ALGORITHMS = ["dfs", "bfs", "a_star"]
+DEFAULT_THRESHOLD = 0.10
+# Time differences below this many seconds are noise, whatever the relative growth
+DEFAULT_SLACK = 0.005
+
+
+def benchmark_cases(sizes, probabilities, algorithms, heuristics, seed):
+    """
+    All combinations of the parameters, a_star is run once per heuristic
+    :return: list of cases (dict)
+    """
+    cases = []
+    for size in sizes:
+        for probability in probabilities:
+            for algorithm in algorithms:
+                for heuristic in (heuristics if algorithm == "a_star" else [None]):
+                    cases.append({"size": size, "probability": probability, "algorithm": algorithm,
+                                  "heuristic": heuristic, "seed": seed})
+    return cases
+
+
+def case_name(case):
+    return "size %d  p %.2f  %s" % (case["size"], case["probability"],
+                                    case["algorithm"] + (" " + case["heuristic"] if case["heuristic"] else ""))
+
+
+def case_key(case):
+    return case["size"], case["probability"], case["algorithm"], case["heuristic"], case["seed"]
+
+
+def peak_rss():
+    """
+    :return: peak resident set size of this process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(case, repeats):
+    """
+    Generate the map of a case and solve it repeats times (executed in a fresh process, so the peak RSS is its own)
+    The timed runs are the plain solvers, the counters come from one more run with stats enabled, so the cost of
+    the instrumentation is not part of the timings.
+    :return: (dict) the case with its timings, counters and memory
+    """
+    # The map only depends on the case, not on which cases run before it
+    a_map = Map(case["size"], case["probability"],
+                seed=[case["seed"], case["size"], int(round(case["probability"] * 1000))])
+    a_map.neighbor_index()
+    map_rss = peak_rss()
+
+    arguments = (case["heuristic"],) if case["heuristic"] else ()
+    times = []
+    for _ in range(repeats):
+        solver = FindSolution(a_map)
+        getattr(solver, case["algorithm"])(*arguments)
+        times.append(solver.time)
+    solve_rss = peak_rss()
+    solution = getattr(FindSolution(a_map, stats=True), case["algorithm"])(*arguments)
+
+    result = dict(case)
+    result.update({"status": solution["Status"],
+                   "path length": solution["Path length"] if solution["Status"] == "Found Path" else None,
+                   "expanded": solution["Stats"]["expanded"], "visited cells": solution["No of visited cells"],
+                   "max frontier": solution["Stats"]["max frontier"],
+                   "time": {"min": min(times), "median": statistics.median(times), "repeats": repeats},
+                   "map rss": map_rss, "peak rss": solve_rss})
+    return result
+
+
+def run_benchmark(cases, repeats=3, log=print):
+    """
+    Run the cases one after the other, each in a new process
+    :param cases: list of cases from benchmark_cases
+    :param repeats: number of times each case is solved, the map is generated once
+    :param log: function called with a line per finished case (None for silence)
+    :return: (dict) environment and results
+    """
+    results = []
+    # Spawned processes start from an empty interpreter, forked ones would inherit the RSS of this one
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for case in cases:
+            result = pool.apply(run_case, (case, repeats))
+            results.append(result)
+            if log is not None:
+                log("%-40s %8.4fs  expanded %9d  peak rss %s"
+                    % (case_name(case), result["time"]["median"], result["expanded"],
+                       describe_bytes(result["peak rss"])))
+
+    environment = {"python": platform.python_version(), "numpy": numpy.__version__, "platform": platform.platform(),
+                   "processor": platform.processor() or platform.machine(),
+                   "date": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return {"environment": environment, "results": results}
+
+
+def compare(benchmark, baseline, threshold=DEFAULT_THRESHOLD, slack=DEFAULT_SLACK):
+    """
+    Compare a benchmark with a baseline run, case by case
+    Median time and peak RSS regress when they grow by more than threshold. The maps are seeded, so any change
+    of expanded cells or path length is a change of behaviour of the solver and is reported too.
+    :param benchmark: (dict) from run_benchmark
+    :param baseline: (dict) from run_benchmark, e.g. loaded from its JSON file
+    :param threshold: allowed relative growth, 0.10 = 10%
+    :param slack: allowed growth of the median time in seconds, for the cases that take a few milliseconds
+    :return: list of (case name, description) of the regressions, empty if there are none
+    """
+    baseline_results = {case_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in benchmark["results"]:
+        old = baseline_results.get(case_key(result))
+        if old is None:
+            continue
+        for name in ["expanded", "path length"]:
+            if result[name] != old[name]:
+                regressions.append((case_name(result), "%s changed from %s to %s" % (name, old[name], result[name])))
+        (time_now, time_before) = (result["time"]["median"], old["time"]["median"])
+        if time_now > time_before * (1 + threshold) and time_now > time_before + slack:
+            regressions.append((case_name(result), "median time %.4fs -> %.4fs (+%.0f%%)"
+                                % (time_before, time_now, 100 * (time_now / time_before - 1))))
+        (rss_now, rss_before) = (result["peak rss"], old["peak rss"])
+        if rss_now is not None and rss_before is not None and rss_now > rss_before * (1 + threshold):
+            regressions.append((case_name(result), "peak rss %s -> %s"
+                                % (describe_bytes(rss_before), describe_bytes(rss_now))))
+    return regressions
+
+
+def describe_bytes(number):
+    if number is None:
+        return "N/A"
+    return "%.1f MB" % (number / 2 ** 20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dfs, bfs and a_star on seeded maps")
+    parser.add_argument("--size", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--probability", type=float, nargs="+", default=PROBABILITIES)
+    parser.add_argument("--algorithm", nargs="+", choices=ALGORITHMS, default=ALGORITHMS)
+    parser.add_argument("--heuristic", nargs="+", choices=list(HEURISTICS), default=list(HEURISTICS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative growth of time and peak RSS")
+    parser.add_argument("--slack", type=float, default=DEFAULT_SLACK, help="allowed growth of time in seconds")
+    args = parser.parse_args()
+
+    cases = benchmark_cases(args.size, args.probability, args.algorithm, args.heuristic, args.seed)
+    benchmark = run_benchmark(cases, args.repeats)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(benchmark, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(benchmark, json.load(baseline_file), args.threshold, args.slack)
+        for (name, description) in regressions:
+            print("REGRESSION  %-40s %s" % (name, description))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against " + args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# Run parameter sweeps of Map / FindSolution over a process pool
+import argparse
+import concurrent.futures
+import itertools
+import json
+import time
+
+import numpy
+
+from MapSearchNoGUI import Map, FindSolution, HEURISTICS
+
+ALGORITHMS = ["dfs", "bfs", "bfs_vectorized", "bidirectional_bfs", "a_star", "bidirectional_a_star", "jps"]
+# Algorithms that take a heuristic
+INFORMED_ALGORITHMS = ["a_star", "bidirectional_a_star"]
+
+
+def trial_map(size, probability, seed, trial):
+    """
+    Regenerate the map of one trial, so workers only receive the parameters and never a pickled grid
+    :return: map object
+    """
+    return Map(size, probability, seed=[seed, trial])
+
+
+def run_trials(experiment, first_trial, number_of_trials):
+    """
+    Run a chunk of trials of one experiment (executed in a worker process)
+    :param experiment: (dict) size, probability, algorithm, heuristic and seed
+    :param first_trial: index of the first trial of the chunk
+    :param number_of_trials: number of trials in the chunk
+    :return: list of (visited cells, path length or None, wall time) per trial
+    """
+    results = []
+    for trial in range(first_trial, first_trial + number_of_trials):
+        a_map = trial_map(experiment["size"], experiment["probability"], experiment["seed"], trial)
+        solver = getattr(FindSolution(a_map), experiment["algorithm"])
+        arguments = (experiment["heuristic"],) if experiment["algorithm"] in INFORMED_ALGORITHMS else ()
+
+        start_time = time.perf_counter()
+        solution = solver(*arguments)
+        wall_time = time.perf_counter() - start_time
+
+        path_length = solution["Path length"] if solution["Status"] == "Found Path" else None
+        results.append((solution["No of visited cells"], path_length, wall_time))
+    return results
+
+
+def summarize(experiment, results):
+    """
+    Aggregate the trials of one experiment
+    :return: (dict) the experiment with mean and variance of visited cells, path length and wall time
+    """
+    visited_cells = numpy.array([result[0] for result in results], dtype=numpy.float64)
+    path_length = numpy.array([result[1] for result in results if result[1] is not None], dtype=numpy.float64)
+    wall_time = numpy.array([result[2] for result in results], dtype=numpy.float64)
+
+    summary = dict(experiment)
+    summary["trials"] = len(results)
+    summary["solvable"] = len(path_length) / len(results)
+    for (name, values) in [("visited cells", visited_cells), ("path length", path_length),
+                           ("wall time", wall_time)]:
+        summary[name] = {"mean": float(values.mean()) if len(values) else None,
+                         "variance": float(values.var()) if len(values) else None}
+    return summary
+
+
+def experiment_grid(sizes, probabilities, algorithms, heuristics, seed):
+    """
+    All combinations of the parameters, the heuristic is only varied for the A* algorithms
+    :return: list of experiments (dict)
+    """
+    experiments = []
+    for (size, probability, algorithm) in itertools.product(sizes, probabilities, algorithms):
+        for heuristic in (heuristics if algorithm in INFORMED_ALGORITHMS else [None]):
+            experiments.append({"size": size, "probability": probability, "algorithm": algorithm,
+                                "heuristic": heuristic, "seed": seed})
+    return experiments
+
+
+def run_experiments(experiments, trials, chunk_size=10, workers=None):
+    """
+    Fan the trials of every experiment out over a process pool, in chunks of chunk_size trials
+    :param experiments: list of experiments from experiment_grid
+    :param trials: number of trials per experiment
+    :param chunk_size: number of trials a worker runs per task
+    :param workers: number of processes (default: number of CPUs)
+    :return: list of summaries, in the order of experiments
+    """
+    results = [[] for _ in experiments]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for (number, experiment) in enumerate(experiments):
+            for first_trial in range(0, trials, chunk_size):
+                future = executor.submit(run_trials, experiment, first_trial, min(chunk_size, trials - first_trial))
+                futures[future] = number
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]].extend(future.result())
+
+    return [summarize(experiment, result) for (experiment, result) in zip(experiments, results)]
+
+
+def describe(statistic):
+    if statistic["mean"] is None:
+        return "N/A"
+    return "%.4g (var %.4g)" % (statistic["mean"], statistic["variance"])
+
+
+def positive_integer(text):
+    """
+    argparse type of the counts that must be at least 1
+    """
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got %d" % value)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Map / FindSolution parameter sweeps over a process pool")
+    parser.add_argument("--size", type=int, nargs="+", default=[100])
+    parser.add_argument("--probability", type=float, nargs="+", default=[0.2])
+    parser.add_argument("--algorithm", nargs="+", choices=ALGORITHMS, default=["a_star"])
+    parser.add_argument("--heuristic", nargs="+", choices=list(HEURISTICS), default=["euclidean"])
+    parser.add_argument("--trials", type=positive_integer, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=positive_integer, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="write the summaries to this JSON file")
+    args = parser.parse_args()
+
+    experiments = experiment_grid(args.size, args.probability, args.algorithm, args.heuristic, args.seed)
+    summaries = run_experiments(experiments, args.trials, args.chunk_size, args.workers)
+
+    for summary in summaries:
+        name = summary["algorithm"] + (" " + summary["heuristic"] if summary["heuristic"] else "")
+        print("size %d  p %.2f  %-20s solvable %.3f  visited cells %s  path length %s  wall time %s"
+              % (summary["size"], summary["probability"], name, summary["solvable"],
+                 describe(summary["visited cells"]), describe(summary["path length"]),
+                 describe(summary["wall time"])))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(summaries, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
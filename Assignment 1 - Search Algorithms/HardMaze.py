@@ -0,0 +1,403 @@
+# Search for the maps that are hardest for a solver (longest path, most visited cells or largest frontier), with
+# hill climbing, simulated annealing or a genetic algorithm whose candidates are evaluated over a process pool
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+from multiprocessing import shared_memory
+
+import numpy
+
+from ExperimentRunner import ALGORITHMS, INFORMED_ALGORITHMS
+from MapFile import save_map, open_map
+from MapSearchNoGUI import Map, FindSolution, VisitedCells, HEURISTICS
+
+METRICS = ["path length", "visited cells", "max frontier"]
+# Algorithms that only look at the cells next to the cells they expand (jps scans whole rows), so flipping a cell
+# that is neither visited nor next to a visited cell gives the same search
+LOCAL_ALGORITHMS = ["dfs", "bfs", "bfs_vectorized", "bidirectional_bfs", "a_star", "bidirectional_a_star"]
+# Algorithms that always find a shortest path: a new wall off the path keeps its length
+SHORTEST_PATH_ALGORITHMS = ["bfs", "bfs_vectorized", "bidirectional_bfs"]
+CHECKPOINT_FILE = "checkpoint.json"
+
+# Copy of the parent map in the worker process and its neighbor index, kept until anneal moves to another map
+worker_parent = {"key": None, "map": None}
+
+
+def evaluate(a_map, algorithm, arguments, metric):
+    """
+    Solve a map and measure how hard it was
+    :param a_map: map object
+    :param algorithm: name of the FindSolution method
+    :param arguments: arguments of the method (the heuristic of the A* algorithms)
+    :param metric: one of METRICS
+    :return: score (-1 if there is no path) and the solution
+    """
+    solution = getattr(FindSolution(a_map, stats=metric == "max frontier"), algorithm)(*arguments)
+    if solution["Status"] != "Found Path":
+        return -1, solution
+    if metric == "path length":
+        return solution["Path length"], solution
+    if metric == "visited cells":
+        return solution["No of visited cells"], solution
+    return solution["Stats"]["max frontier"], solution
+
+
+def evaluate_mutations(mutations, key, parent, algorithm, arguments, metric):
+    """
+    Score mutations of a parent map (executed in a worker process)
+    Each mutation is applied with Map.set_cell, which patches the neighbor index of the parent instead of building
+    it again, evaluated and undone.
+    :param mutations: list of arrays of flat indices of the cells to flip
+    :param key: identifier of the parent, the parent is only read and rebuilt when it changes
+    :param parent: (n*n matrix) the parent map, or (name, shape, dtype) of the shared memory block holding it, so
+                   tasks do not carry the map
+    :return: list of scores
+    """
+    if worker_parent["key"] != key:
+        if isinstance(parent, tuple):
+            (name, shape, dtype) = parent
+            block = shared_memory.SharedMemory(name=name)
+            matrix = numpy.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+            block.close()
+        else:
+            matrix = numpy.array(parent)
+        worker_parent["key"] = key
+        worker_parent["map"] = Map.from_matrix(matrix)
+    a_map = worker_parent["map"]
+
+    scores = []
+    for cells in mutations:
+        cells = [divmod(int(index), a_map.size) for index in cells]
+        for (x, y) in cells:
+            a_map.set_cell(x, y, not a_map.map[x, y])
+        scores.append(evaluate(a_map, algorithm, arguments, metric)[0])
+        for (x, y) in cells:
+            a_map.set_cell(x, y, not a_map.map[x, y])
+    return scores
+
+
+def evaluate_maps(matrices, algorithm, arguments, metric):
+    """
+    Score whole maps (executed in a worker process)
+    :return: list of scores
+    """
+    return [evaluate(Map.from_matrix(matrix), algorithm, arguments, metric)[0] for matrix in matrices]
+
+
+class HardMazeSearch:
+    def __init__(self, size, probability, algorithm="bfs", heuristic="euclidean", metric="path length", seed=None,
+                 workers=None, checkpoint_directory=None, keep=10):
+        """
+        Local search over maps, maximizing the metric of one solver
+        :param size: size of the maps
+        :param probability: wall probability of the first map(s)
+        :param algorithm: name of the FindSolution method
+        :param heuristic: heuristic of the A* algorithms
+        :param metric: one of METRICS
+        :param seed: seed of the random generator
+        :param workers: number of processes (default: number of CPUs, 0 to evaluate in this process)
+        :param checkpoint_directory: directory the best maps are written to, and resumed from if it has some
+        :param keep: number of best maps kept
+        """
+        if metric not in METRICS:
+            raise ValueError("metric is one of " + ", ".join(METRICS))
+        self.size = size
+        self.probability = probability
+        self.algorithm = algorithm
+        self.arguments = (heuristic,) if algorithm in INFORMED_ALGORITHMS else ()
+        self.metric = metric
+        # Arguments of evaluate that name the search, sent to the workers with every task
+        self.search = (algorithm, self.arguments, metric)
+        self.generator = numpy.random.default_rng(seed)
+        self.workers = os.cpu_count() if workers is None else workers
+        self.checkpoint_directory = checkpoint_directory
+        self.keep = keep
+
+        # Best maps found so far, (score, matrix) from best to worst
+        self.best = []
+        self.evaluations = 0
+        self.skipped = 0
+        self.steps = 0
+        # Number of parent maps published by anneal, identifies the parent map copied by the workers
+        self.moves = 0
+        self.executor = None
+        # Shared memory block the parent map is written to once per move, for the workers to copy
+        self.shared_parent = None
+        if checkpoint_directory is not None:
+            os.makedirs(checkpoint_directory, exist_ok=True)
+            self.load_checkpoint()
+
+    def __enter__(self):
+        if self.workers:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return self
+
+    def __exit__(self, *exception):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.shared_parent is not None:
+            self.shared_parent.close()
+            self.shared_parent.unlink()
+            self.shared_parent = None
+
+    def publish_parent(self, matrix):
+        """
+        Make matrix the parent map of evaluate_mutations, under a new key
+        With workers, the map is copied into shared memory here, once per move, instead of being sent with every
+        task.
+        :return: key and parent arguments of evaluate_mutations
+        """
+        self.moves += 1
+        if self.executor is None:
+            return (id(self), self.moves), matrix
+        if self.shared_parent is None:
+            self.shared_parent = shared_memory.SharedMemory(create=True, size=matrix.nbytes)
+        numpy.ndarray(matrix.shape, dtype=matrix.dtype, buffer=self.shared_parent.buf)[:] = matrix
+        return (self.shared_parent.name, self.moves), (self.shared_parent.name, matrix.shape, matrix.dtype.str)
+
+    def scatter(self, function, items, *arguments):
+        """
+        Run function(chunk of items, *arguments) on one chunk per worker, over the process pool (or here without
+        workers)
+        :return: concatenated results, in the order of items
+        """
+        if self.executor is None:
+            return function(items, *arguments)
+        chunks = [chunk for chunk in numpy.array_split(numpy.arange(len(items)), self.workers) if len(chunk)]
+        futures = [self.executor.submit(function, [items[i] for i in chunk], *arguments) for chunk in chunks]
+        return [score for future in futures for score in future.result()]
+
+    def random_matrix(self):
+        """
+        :return: (n*n matrix) a random solvable map
+        """
+        while True:
+            a_map = Map(self.size, self.probability, seed=self.generator)
+            if FindSolution(a_map).solvable():
+                return a_map.map
+
+    def record(self, score, matrix):
+        """
+        Keep a map if it is among the best ones
+        :return: (boolean) True if the best maps changed
+        """
+        if score < 0 or (len(self.best) == self.keep and score <= self.best[-1][0]):
+            return False
+        if any(numpy.array_equal(matrix, kept) for (_, kept) in self.best):
+            return False
+        self.best.append((score, matrix.copy()))
+        self.best.sort(key=lambda item: -item[0])
+        del self.best[self.keep:]
+        return True
+
+    def mutable_cells(self, solution):
+        """
+        Cells whose flip can change the score of a map, start and finish stay empty
+        :return: (numpy array) flat indices
+        """
+        if self.algorithm in LOCAL_ALGORITHMS and isinstance(solution["Visited cells"], VisitedCells):
+            # Visited cells and their neighbors
+            visited = numpy.asarray(solution["Visited cells"].visited)[:self.size * self.size]
+            cells = visited.reshape(self.size, self.size).astype(bool)
+            cells[1:, :] |= cells[:-1, :].copy()
+            cells[:-1, :] |= cells[1:, :].copy()
+            cells[:, 1:] |= cells[:, :-1].copy()
+            cells[:, :-1] |= cells[:, 1:].copy()
+        else:
+            cells = numpy.ones((self.size, self.size), dtype=bool)
+        cells[0, 0] = cells[-1, -1] = False
+        return numpy.flatnonzero(cells)
+
+    def path_unchanged(self, matrix, path_cells, mutation):
+        """
+        A mutation that only adds walls off the shortest path keeps the path length
+        """
+        return (self.metric == "path length" and self.algorithm in SHORTEST_PATH_ALGORITHMS
+                and not path_cells[mutation].any() and not matrix.reshape(-1)[mutation].any())
+
+    def anneal(self, steps, batch_size=64, flips=2, temperature=1.0, cooling=0.999, checkpoint_every=100):
+        """
+        Simulated annealing: every step scores batch_size mutations of the current map (flipping flips cells each)
+        over the process pool and moves to the best one if it is not worse, or with probability
+        exp(score change / temperature) if it is. A temperature of 0 is hill climbing.
+        :param steps: number of steps
+        :param batch_size: number of mutations per step
+        :param flips: number of cells flipped by a mutation
+        :param temperature: first temperature, in units of the metric
+        :param cooling: the temperature is multiplied by cooling every step
+        :param checkpoint_every: steps between checkpoints
+        :return: (score, matrix) of the best map
+        """
+        matrix = self.best[0][1].copy() if self.best else self.random_matrix()
+        a_map = Map.from_matrix(matrix)
+        (score, solution) = evaluate(a_map, self.algorithm, self.arguments, self.metric)
+        self.evaluations += 1
+        self.record(score, matrix)
+        parent = self.publish_parent(matrix)
+
+        for step in range(steps):
+            cells = self.mutable_cells(solution)
+            path_cells = numpy.zeros(self.size * self.size, dtype=bool)
+            if solution["Path"]:
+                path_cells[[x * self.size + y for (x, y) in solution["Path"]]] = True
+            mutations = [self.generator.choice(cells, size=min(flips, len(cells)), replace=False)
+                         for _ in range(batch_size)]
+
+            scores = numpy.full(batch_size, score)
+            evaluated = [i for (i, mutation) in enumerate(mutations)
+                         if not self.path_unchanged(matrix, path_cells, mutation)]
+            self.skipped += batch_size - len(evaluated)
+            if evaluated:
+                scores[evaluated] = self.scatter(evaluate_mutations, [mutations[i] for i in evaluated], *parent,
+                                                 *self.search)
+                self.evaluations += len(evaluated)
+
+            best = int(numpy.argmax(scores))
+            change = scores[best] - score
+            if change >= 0 or (temperature > 0 and self.generator.random() < math.exp(change / temperature)):
+                flat = matrix.reshape(-1)
+                flat[mutations[best]] ^= 1
+                # Map.map setter, the neighbor index is built again for the new map
+                a_map.map = matrix
+                parent = self.publish_parent(matrix)
+                (score, solution) = evaluate(a_map, self.algorithm, self.arguments, self.metric)
+                self.evaluations += 1
+                self.record(score, matrix)
+
+            temperature *= cooling
+            self.steps += 1
+            if self.checkpoint_directory is not None and (step + 1) % checkpoint_every == 0:
+                self.save_checkpoint()
+
+        if self.checkpoint_directory is not None:
+            self.save_checkpoint()
+        return self.best[0]
+
+    def climb(self, steps, batch_size=64, flips=1, checkpoint_every=100):
+        """
+        Hill climbing, anneal at temperature 0 (moves to equal scores are taken to cross plateaus)
+        """
+        return self.anneal(steps, batch_size, flips, 0.0, 1.0, checkpoint_every)
+
+    def evolve(self, generations, population=64, flips=2, tournament=3, elite=2, checkpoint_every=10):
+        """
+        Genetic algorithm: children take the rows above a random row from one parent and the rest from the other,
+        then get flips random cells flipped. Parents are picked by tournament, the elite best maps survive.
+        :param generations: number of generations
+        :param population: number of maps per generation
+        :param flips: number of cells flipped in each child
+        :param tournament: number of maps competing to be a parent
+        :param elite: number of best maps copied to the next generation
+        :param checkpoint_every: generations between checkpoints
+        :return: (score, matrix) of the best map
+        """
+        maps = [matrix.copy() for (_, matrix) in self.best[:population]]
+        maps += [self.random_matrix() for _ in range(population - len(maps))]
+        scores = numpy.array(self.scatter(evaluate_maps, maps, *self.search))
+        self.evaluations += population
+
+        for generation in range(generations):
+            order = numpy.argsort(-scores)
+            for i in order[:elite]:
+                self.record(scores[i], maps[i])
+
+            def pick():
+                competitors = self.generator.integers(population, size=tournament)
+                return maps[competitors[numpy.argmax(scores[competitors])]]
+
+            children = [maps[i].copy() for i in order[:elite]]
+            while len(children) < population:
+                row = self.generator.integers(1, self.size)
+                child = numpy.concatenate([pick()[:row], pick()[row:]])
+                flat = child.reshape(-1)
+                flat[self.generator.integers(self.size * self.size, size=flips)] ^= 1
+                flat[0] = flat[-1] = 0
+                children.append(child)
+
+            # The elite keep their scores, only the new children are evaluated
+            new_scores = self.scatter(evaluate_maps, children[elite:], *self.search)
+            self.evaluations += len(children) - elite
+            scores = numpy.concatenate([scores[order[:elite]], new_scores])
+            maps = children
+            self.steps += 1
+            if self.checkpoint_directory is not None and (generation + 1) % checkpoint_every == 0:
+                self.save_checkpoint()
+
+        for i in numpy.argsort(-scores)[:elite]:
+            self.record(scores[i], maps[i])
+        if self.checkpoint_directory is not None:
+            self.save_checkpoint()
+        return self.best[0]
+
+    def save_checkpoint(self):
+        """
+        Write the best maps as map files (see MapFile) and their scores to checkpoint.json
+        """
+        entries = []
+        for (rank, (score, matrix)) in enumerate(self.best):
+            name = "best-%03d.map" % rank
+            save_map(os.path.join(self.checkpoint_directory, name), Map.from_matrix(matrix, self.probability))
+            entries.append({"file": name, "score": int(score)})
+        checkpoint = {"size": self.size, "algorithm": self.algorithm, "arguments": list(self.arguments),
+                      "metric": self.metric, "evaluations": self.evaluations, "skipped": self.skipped,
+                      "steps": self.steps, "maps": entries}
+        # Write the index last and atomically, a crash leaves the previous checkpoint readable
+        path = os.path.join(self.checkpoint_directory, CHECKPOINT_FILE)
+        with open(path + ".tmp", "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def load_checkpoint(self):
+        """
+        Resume from the best maps of a checkpoint of the same search, if there is one
+        """
+        path = os.path.join(self.checkpoint_directory, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if (checkpoint["size"], checkpoint["algorithm"], checkpoint["arguments"], checkpoint["metric"]) != \
+                (self.size, self.algorithm, list(self.arguments), self.metric):
+            raise ValueError(path + " is a checkpoint of another search")
+        self.best = [(entry["score"], numpy.array(open_map(os.path.join(self.checkpoint_directory, entry["file"])).map))
+                     for entry in checkpoint["maps"]]
+        (self.evaluations, self.skipped, self.steps) = (checkpoint["evaluations"], checkpoint["skipped"],
+                                                        checkpoint["steps"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for the maps that are hardest for a solver")
+    parser.add_argument("--method", choices=["climb", "anneal", "evolve"], default="anneal")
+    parser.add_argument("--size", type=int, default=100)
+    parser.add_argument("--probability", type=float, default=0.3)
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="bfs")
+    parser.add_argument("--heuristic", choices=list(HEURISTICS), default="euclidean")
+    parser.add_argument("--metric", choices=METRICS, default="path length")
+    parser.add_argument("--steps", type=int, default=1000, help="steps (climb, anneal) or generations (evolve)")
+    parser.add_argument("--batch-size", type=int, default=64, help="mutations per step or maps per generation")
+    parser.add_argument("--flips", type=int, default=2)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--cooling", type=float, default=0.999)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--checkpoint", help="directory of the best maps, resumed from if it exists")
+    parser.add_argument("--keep", type=int, default=10)
+    args = parser.parse_args()
+
+    search = HardMazeSearch(args.size, args.probability, args.algorithm, args.heuristic, args.metric, args.seed,
+                            args.workers, args.checkpoint, args.keep)
+    with search:
+        if args.method == "climb":
+            (score, matrix) = search.climb(args.steps, args.batch_size, args.flips)
+        elif args.method == "anneal":
+            (score, matrix) = search.anneal(args.steps, args.batch_size, args.flips, args.temperature, args.cooling)
+        else:
+            (score, matrix) = search.evolve(args.steps, args.batch_size, args.flips)
+    print("best %s: %d  (%d evaluations, %d skipped)" % (args.metric, score, search.evaluations, search.skipped))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# Repair the shortest path of a Map after cells change or the start moves, instead of solving again (D* Lite)
+import heapq
+import itertools
+
+import numpy
+
+from MapSearchNoGUI import DIRECTIONS, VisitedCells
+
+
+class IncrementalPlanner:
+    def __init__(self, a_map, start_position=(0, 0), end_position=None):
+        """
+        D* Lite planner attached to a map. It searches from the finish toward the start, so when walls change
+        (set_cell) or the start moves (move_start, advance) plan only revisits the cells whose distance to the
+        finish changed.
+        :param a_map: map object, change its cells through set_cell so the planner sees them
+        :param start_position: (x, y) coordinate of the start
+        :param end_position: (x, y) coordinate of the finish, (size - 1, size - 1) by default
+        """
+        self.a_map = a_map
+        self.size = a_map.size
+        self.start_position = tuple(start_position)
+        self.end_position = (a_map.size - 1, a_map.size - 1) if end_position is None else tuple(end_position)
+
+        number_of_cells = self.size * self.size
+        index_type = numpy.int32 if number_of_cells < 2 ** 31 else numpy.int64
+        self.infinity = int(numpy.iinfo(index_type).max)
+        # g: distance to the finish of the last expansion, rhs: one step lookahead, consistent when equal
+        self.g = numpy.full(number_of_cells, self.infinity, dtype=index_type)
+        self.rhs = numpy.full(number_of_cells, self.infinity, dtype=index_type)
+        self.visited = numpy.zeros(number_of_cells, dtype=numpy.bool_)
+        (self.g_view, self.rhs_view, self.is_visited) = (memoryview(self.g), memoryview(self.rhs),
+                                                         memoryview(self.visited))
+        self.count = 0
+
+        # Priority queue with lazy deletion, queued[cell] is the current key of the cells in it
+        self.queue = []
+        self.queued = {}
+        self.counter = itertools.count()
+        # Key modifier, grows by the distance the start moves so the keys in the queue stay lower bounds
+        self.key_modifier = 0
+
+        end = self.index_of(self.end_position)
+        self.rhs_view[end] = 0
+        self.push(end, self.calculate_key(end))
+
+    def index_of(self, cell):
+        return cell[0] * self.size + cell[1]
+
+    def distance_to_start(self, index):
+        (x, y) = divmod(index, self.size)
+        return abs(x - self.start_position[0]) + abs(y - self.start_position[1])
+
+    def calculate_key(self, index):
+        lowest = min(self.g_view[index], self.rhs_view[index])
+        if lowest == self.infinity:
+            return self.infinity, self.infinity
+        return lowest + self.distance_to_start(index) + self.key_modifier, lowest
+
+    def push(self, index, key):
+        self.queued[index] = key
+        heapq.heappush(self.queue, (key, next(self.counter), index))
+
+    def top(self):
+        """
+        :return: (key, index) of the queued cell with the lowest key, None if the queue is empty
+        """
+        while self.queue:
+            (key, _, index) = self.queue[0]
+            if self.queued.get(index) == key:
+                return key, index
+            heapq.heappop(self.queue)
+        return None
+
+    def update_vertex(self, index):
+        if self.g_view[index] != self.rhs_view[index]:
+            self.push(index, self.calculate_key(index))
+        else:
+            self.queued.pop(index, None)
+
+    def lookahead(self, index, walls, masks, steps):
+        """
+        :return: rhs of a cell, 1 + the lowest g of its empty neighbors (infinity for walls)
+        """
+        if walls[index]:
+            return self.infinity
+        lowest = min([self.g_view[index + step] for step in steps[masks[index]]], default=self.infinity)
+        return lowest + 1 if lowest < self.infinity else self.infinity
+
+    def compute_shortest_path(self):
+        """
+        Expand the inconsistent cells until the start is consistent and no queued cell can change its distance
+        :return: number of cells expanded
+        """
+        (masks, steps) = self.a_map.neighbor_index()
+        walls = memoryview(self.a_map.map.reshape(-1))
+        (g, rhs, is_visited) = (self.g_view, self.rhs_view, self.is_visited)
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        expanded = 0
+
+        while True:
+            top = self.top()
+            if top is None:
+                break
+            (key, current_cell) = top
+            if key >= self.calculate_key(start) and rhs[start] <= g[start]:
+                break
+
+            new_key = self.calculate_key(current_cell)
+            if key < new_key:
+                # Queued before the start moved, put back with its up to date key
+                self.push(current_cell, new_key)
+                continue
+
+            heapq.heappop(self.queue)
+            del self.queued[current_cell]
+            expanded += 1
+            if not is_visited[current_cell]:
+                is_visited[current_cell] = True
+                self.count += 1
+
+            if walls[current_cell]:
+                neighbors = []
+            else:
+                neighbors = [current_cell + step for step in steps[masks[current_cell]]]
+            if g[current_cell] > rhs[current_cell]:
+                # Distance went down (or was found): the neighbors may now go through this cell
+                g[current_cell] = rhs[current_cell]
+                for cell in neighbors:
+                    if cell != end and rhs[current_cell] + 1 < rhs[cell]:
+                        rhs[cell] = rhs[current_cell] + 1
+                        self.update_vertex(cell)
+            else:
+                # Distance went up: the cell and the neighbors that went through it look again
+                old_distance = g[current_cell]
+                g[current_cell] = self.infinity
+                for cell in neighbors + [current_cell]:
+                    if cell != end and (cell == current_cell or rhs[cell] == old_distance + 1):
+                        rhs[cell] = self.lookahead(cell, walls, masks, steps)
+                    self.update_vertex(cell)
+
+        return expanded
+
+    def set_cell(self, x, y, blocked):
+        """
+        Change a cell of the map to a wall or an empty cell, the path is repaired by the next plan
+        :param x: x coordinate of the cell
+        :param y: y coordinate of the cell
+        :param blocked: (boolean) True for a wall, False for an empty cell
+        """
+        if bool(self.a_map.map[x, y]) == bool(blocked):
+            return
+        self.a_map.set_cell(x, y, blocked)
+
+        (masks, steps) = self.a_map.neighbor_index()
+        walls = memoryview(self.a_map.map.reshape(-1))
+        end = self.index_of(self.end_position)
+        for (dx, dy) in [(0, 0)] + DIRECTIONS:
+            if self.a_map.in_bounds((x + dx, y + dy)):
+                cell = self.index_of((x + dx, y + dy))
+                if cell != end:
+                    self.rhs_view[cell] = self.lookahead(cell, walls, masks, steps)
+                self.update_vertex(cell)
+
+    def move_start(self, cell):
+        """
+        Search from another start, e.g. the next cell of the path, the next plan reuses everything found so far
+        :param cell: (x, y) coordinate of the new start
+        """
+        self.key_modifier += abs(cell[0] - self.start_position[0]) + abs(cell[1] - self.start_position[1])
+        self.start_position = tuple(cell)
+
+    def advance(self, number_of_steps=1):
+        """
+        Move the start along the current path toward the finish
+        :param number_of_steps: number of cells to move
+        :return: (x, y) coordinate of the new start
+        """
+        path = self.extract_path()
+        if path is not None and path:
+            self.move_start(path[min(number_of_steps, len(path)) - 1])
+        return self.start_position
+
+    def extract_path(self):
+        """
+        :return: list of the cells from the cell after the start to the finish, None if there is no path
+        """
+        (masks, steps) = self.a_map.neighbor_index()
+        walls = memoryview(self.a_map.map.reshape(-1))
+        g = self.g_view
+        current = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        # The search may stop with the start itself not expanded yet, its lookahead (rhs) is its distance
+        if walls[current] or walls[end] or self.rhs_view[current] == self.infinity:
+            return None
+
+        path = []
+        while current != end:
+            neighbors = [current + step for step in steps[masks[current]]]
+            if not neighbors or len(path) > len(g):
+                return None
+            current = min(neighbors, key=g.__getitem__)
+            if g[current] == self.infinity:
+                return None
+            path.append(divmod(current, self.size))
+        return path
+
+    def plan(self):
+        """
+        Repair the shortest path from the start to the finish after the latest changes
+        :return: list of status, visited cell (every cell expanded since the planner was made), path, path
+                 length, and "Expanded cells" (cells expanded by this repair)
+        """
+        expanded = self.compute_shortest_path()
+        path = self.extract_path()
+        visited_cells = VisitedCells(self.visited, self.size, self.count)
+        if path is None:
+            return {"Status": "Path Not Found!!!", "Visited cells": visited_cells, "No of visited cells": self.count,
+                    "Path": [], "Path length": "N/A", "Expanded cells": expanded}
+        # The path of a solution lists the cells between start and finish
+        path = path[:-1]
+        return {"Status": "Found Path", "Visited cells": visited_cells, "No of visited cells": self.count,
+                "Path": path, "Path length": len(path), "Expanded cells": expanded}
+
+
+if __name__ == "__main__":
+    import time
+
+    from MapSearchNoGUI import Map
+
+    current_map = Map(2000, 0.2, seed=1)
+    planner = IncrementalPlanner(current_map)
+    start_time = time.perf_counter()
+    solution = planner.plan()
+    print("First plan: path length %s, %d cells expanded, %.2fs"
+          % (solution["Path length"], solution["Expanded cells"], time.perf_counter() - start_time))
+
+    # Block cells of the path one at a time, moving the start a few cells along between changes
+    for step in range(5):
+        (x, y) = solution["Path"][len(solution["Path"]) // 2]
+        planner.set_cell(x, y, True)
+        start_time = time.perf_counter()
+        solution = planner.plan()
+        print("Blocked (%d, %d): path length %s, %d cells expanded, %.3fs"
+              % (x, y, solution["Path length"], solution["Expanded cells"], time.perf_counter() - start_time))
+        planner.advance(10)
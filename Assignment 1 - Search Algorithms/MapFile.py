@@ -0,0 +1,100 @@
+# Binary map files, opened with numpy.memmap so huge maps are never loaded whole
+#
+# Layout (little endian):
+#   HEADER_BYTES bytes   header: magic, version, size, probability, seed (-1 if unknown)
+#   size * size bytes    walls, one uint8 per cell (1 for walls), row major
+#   size * size bytes    neighbor masks of the cells (see fill_neighbor_masks)
+import numbers
+
+import numpy
+
+from MapSearchNoGUI import Map, generate_walls, fill_neighbor_masks
+
+MAGIC = b"CS440MAP"
+VERSION = 1
+HEADER = numpy.dtype([("magic", "S8"), ("version", "<u4"), ("reserved", "<u4"), ("size", "<u8"),
+                      ("probability", "<f8"), ("seed", "<i8")])
+HEADER_BYTES = 64
+
+
+def write_header(path, size, probability, seed):
+    header = numpy.zeros(1, dtype=HEADER)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["size"] = size
+    header["probability"] = probability
+    # NumPy integer seeds are seeds too, generators and sequences are not stored
+    header["seed"] = int(seed) if isinstance(seed, numbers.Integral) else -1
+    with open(path, "wb") as map_file:
+        map_file.write(header.tobytes().ljust(HEADER_BYTES, b"\0"))
+        # Make the file full length, the sections are filled through memmaps
+        map_file.truncate(HEADER_BYTES + 2 * size * size)
+
+
+def read_header(path):
+    """
+    :return: size, probability and seed (None if unknown) of a map file
+    """
+    header = numpy.fromfile(path, dtype=HEADER, count=1)
+    if len(header) == 0 or header["magic"][0] != MAGIC:
+        raise ValueError(path + " is not a map file")
+    if header["version"][0] != VERSION:
+        raise ValueError(path + " has version " + str(header["version"][0]) + ", expected " + str(VERSION))
+    seed = int(header["seed"][0])
+    return int(header["size"][0]), float(header["probability"][0]), (seed if seed >= 0 else None)
+
+
+def sections(path, size, mode):
+    """
+    :return: memmaps of the walls and of the neighbor masks of a map file
+    """
+    walls = numpy.memmap(path, dtype=numpy.uint8, mode=mode, offset=HEADER_BYTES, shape=(size, size))
+    masks = numpy.memmap(path, dtype=numpy.uint8, mode=mode, offset=HEADER_BYTES + size * size, shape=(size, size))
+    return walls, masks
+
+
+def create_map_file(path, size, probability, seed=None):
+    """
+    Generate a map straight into a file, a chunk of rows at a time, same map as Map(size, probability, seed=seed)
+    :param path: path of the new file
+    :param size: size of map
+    :param probability: 0.0 - 1.0 (0: all empty cells, 1: all walls)
+    :param seed: seed of the random generator
+    """
+    if probability > 1 or probability < 0:
+        raise ValueError("probability is in range 0 and 1")
+
+    write_header(path, size, probability, seed)
+    (walls, masks) = sections(path, size, "r+")
+    generate_walls(walls, probability, numpy.random.default_rng(seed))
+    # Set start and finish
+    walls[0, 0] = walls[size - 1, size - 1] = 0
+    fill_neighbor_masks(walls, masks)
+    walls.flush()
+    masks.flush()
+
+
+def save_map(path, a_map):
+    """
+    Write an existing map object to a file
+    """
+    write_header(path, a_map.size, a_map.probability or 0.0, a_map.seed)
+    (walls, masks) = sections(path, a_map.size, "r+")
+    walls[:] = a_map.map
+    fill_neighbor_masks(walls, masks)
+    walls.flush()
+    masks.flush()
+
+
+def open_map(path, mode="r"):
+    """
+    Open a map file without reading it, the solvers of FindSolution page the cells in as they visit them
+    :param path: path of the file
+    :param mode: "r" for read only, "r+" to allow Map.set_cell (changes are written to the file)
+    :return: map object whose matrix and neighbor index are memmaps of the file
+    """
+    (size, probability, seed) = read_header(path)
+    (walls, masks) = sections(path, size, mode)
+    a_map = Map.from_matrix(walls, probability, seed)
+    a_map.use_neighbor_masks(masks)
+    return a_map
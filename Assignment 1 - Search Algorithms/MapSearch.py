@@ -4,288 +4,275 @@ try:
 except ImportError:
     import SimpleGUICS2Pygame.simpleguics2pygame as simplegui
 
-# Import Matrix generator module
+import atexit
+import os
+import pathlib
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+
 import numpy
-import queue
-import math
+
+# Import Map generator and search algorithms
+import MapSearchNoGUI
+from MapSearchNoGUI import FindSolution, VisitedCells
+from IncrementalSearch import IncrementalPlanner
 
 FRAME_WIDTH = 700
 DEFAULT_SIZE = 100
 DEFAULT_PROBABILITY = 0.2
 COLOR_LIST = [["#F44336", "#FFCDD2"], ["#2196F3", "#BBDEFB"], ["#4CAF50", "#C8E6C9"],
               ["#FF9800", "#FFE0B2"], ["#E91E63", "#F8BBD0"], ["#9C27B0", "#E1BEE7"]]
-color = []
-
-
-class Map:
-    def __init__(self, size, probability):
-        """Initialize a new map object.
-        Args:
-            size (int): size of map 10 - 1000
-            probability (double): 0.0 - 1.0 (0: all empty cells, 1: all walls)
-        Returns:
-            map object (n*n matrix) with n*n*p empty cells and n*n*(1-p) filled cells
+# Cells drawn smaller than this many pixels have no outline
+OUTLINE_MIN_WIDTH = 4
+color = COLOR_LIST[0]
+planner = None
+# Solution computed by the solver thread, shown by the next frame: (solution, color, algorithm name)
+pending = None
+solving = False
+# Directory of the PNG files of images loaded by URL, removed at exit (see load_image)
+image_directory = None
+
+
+def rgb(hex_color):
+    return [int(hex_color[i:i + 2], 16) for i in (1, 3, 5)]
+
+
+def write_png(path, image):
+    """
+    Save an (height x width x 3) uint8 image as a PNG file (no imaging library needed)
+    """
+    (height, width) = image.shape[:2]
+    # Every row starts with filter type 0 (none)
+    rows = numpy.zeros((height, width * 3 + 1), dtype=numpy.uint8)
+    rows[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    with open(path, "wb") as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        png_file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        png_file.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 1)))
+        png_file.write(chunk(b"IEND", b""))
+
+
+def load_image(image):
+    """
+    Turn an RGB array into an image the canvas can draw
+    SimpleGUICS2Pygame reads a local file at once with its private _load_local_image, so the PNG is removed right
+    after. If that function is gone, the public load_image gets a file:// URL. The image may then load after
+    load_image returns, so the PNG is kept until the program exits.
+    """
+    global image_directory
+    load_local_image = getattr(simplegui, "_load_local_image", None)
+    if callable(load_local_image):
+        (handle, path) = tempfile.mkstemp(suffix=".png")
+        os.close(handle)
+        try:
+            write_png(path, image)
+            return load_local_image(path)
+        finally:
+            os.remove(path)
+
+    if image_directory is None:
+        image_directory = tempfile.mkdtemp(prefix="MapSearch-")
+        atexit.register(shutil.rmtree, image_directory, True)
+    # A new name for every image, load_image caches images by URL
+    (handle, path) = tempfile.mkstemp(suffix=".png", dir=image_directory)
+    os.close(handle)
+    write_png(path, image)
+    return simplegui.load_image(pathlib.Path(path).as_uri())
+
+
+class Viewport:
+    def __init__(self, size):
+        """
+        Part of the map shown on the canvas, in cells
+        :param size: size of the map
         """
         self.size = size
-        self.probability = probability
+        self.zoom = 1
+        self.center = (size / 2, size / 2)
 
-        # Check if arguments are valid
-        if probability > 1 or probability < 0:
-            raise ValueError("probability is in range 0 and 1")
+    @property
+    def span(self):
+        # Number of cells across the canvas
+        return self.size / self.zoom
 
-        # Generate a uniform distribution matrix (values range from 0.0 to 1.0)
-        self.map = numpy.random.uniform(size=[size, size])
-        # Generate matrix with n*n*p empty cells
-        self.map = (self.map < probability).astype(int)
+    def zoom_by(self, factor):
+        self.zoom = min(max(1, self.zoom * factor), self.size)
+        self.pan(0, 0)
 
-        # Set start and finish
-        self.map[0, 0] = self.map[size - 1, size - 1] = 0
-
-        # Dictionary of solution information
-        self.solution = {"Status": "N/A", "Visited cells": [], "No of visited cells": "N/A", "Path": [],
-                         "Path length": "N/A"}
-
-    def connected_cells(self, cell):
+    def pan(self, dx, dy):
         """
-        Find all connected cells around a cell
-        :param cell: list of (x, y) coordinate of a cell in a numpy array
-        :return:
+        Move the viewport by a fraction of its width (dx, dy in -1 .. 1), staying inside the map
         """
-        x = cell[0]
-        y = cell[1]
-        connected_cells = set()
-        all_possible_cells = [(x, y + 1), (x - 1, y), (x, y - 1), (x + 1, y)]
-        for (i, j) in all_possible_cells:
-            if self.in_bounds((i, j)):
-                if self.map[i, j] == 0:
-                    connected_cells.add((i, j))
-        return connected_cells
-
-    def in_bounds(self, cell):
+        half = self.span / 2
+        self.center = tuple(min(max(half, center + delta * self.span), self.size - half)
+                            for (center, delta) in zip(self.center, (dx, dy)))
+
+    def cell_at(self, position):
         """
-        Check if a cell is in the map
-        :param cell: (x, y) coordinate of the cell
-        :return: (boolean)
+        :param position: (x, y) pixel position on the canvas
+        :return: (x, y) coordinate of the cell under it
         """
-        x = cell[0]
-        y = cell[1]
-        return (0 <= x < self.size) and (0 <= y < self.size)
+        scale = self.span / FRAME_WIDTH
+        return tuple(int(center - self.span / 2 + pixel * scale) for (center, pixel) in zip(self.center, position))
 
-    # Print map on console
-    def print_map(self):
-        print(self.map)
 
-    def print_solution(self):
-        print("Status: " + self.solution["Status"])
-        print("No of visited cells: " + str(self.solution["No of visited cells"]))
-        print("Path length: " + str(self.solution["Path length"]))
+class Map(MapSearchNoGUI.Map):
+    @property
+    def solution(self):
+        return self._solution
 
-    # Draw map on canvas
-    def draw_map(self, canvas):
-        # Determine the width of each cell
-        width = FRAME_WIDTH / self.size
-        for x in range(0, self.size):
-            for y in range(0, self.size):
-                points = [(x * width, y * width), ((x + 1) * width, y * width),
-                          ((x + 1) * width, (y + 1) * width), ((x * width), (y + 1) * width)]
-
-                # Draw first and last cell
-                if (x, y) == (0, 0) or (x, y) == (self.size - 1, self.size - 1):
-                    canvas.draw_polygon(points, 1, "Black", "#00FF00")
-                # Draw path from start to finish
-                elif (x, y) in self.solution["Path"]:
-                    canvas.draw_polygon(points, 1, "Black", color[0])
-                # Draw visited cells
-                elif (x, y) in self.solution["Visited cells"] and (x, y) not in self.solution["Path"]:
-                    canvas.draw_polygon(points, 1, "Black", color[1])
-                # Draw empty cells
-                elif self.map[x, y] == 0:
-                    canvas.draw_polygon(points, 1, "Black", "White")
-                # Draw walls
-                else:
-                    canvas.draw_polygon(points, 1, "Black", "#464646")
-
-
-class FindSolution:
-    def __init__(self, a_map):
-        self.a_map = a_map
-        self.time = 0
-        self.result = "N/A"
-        self.start_position = (0, 0)
-        self.end_position = (a_map.size - 1, a_map.size - 1)
-
-    def build_path(self, path_dictionary):
-        """
-        Build a path (list) from a dictionary of parent cell -> child cell
-        :param path_dictionary: (dic) (child.x, child,y) -> (parent.x, parent.y) Child:key, Parent:value
-        :return: list of path from start to finish
-        """
-        path = []
-        current = path_dictionary[self.end_position]
-        while current != (0, 0):
-            path += (current,)
-            current = path_dictionary[current]
-        return path[::-1]
-
-    def dfs(self):
+    @solution.setter
+    def solution(self, value):
+        # A new solution changes the picture
+        self._solution = value
+        self.image = None
+
+    def set_cell(self, x, y, blocked):
+        super().set_cell(x, y, blocked)
+        self.image = None
+
+    def render(self):
         """
-        Find path using Depth First Search
-        :return: list of status, visited cell, path, and path length
+        Composite walls, visited cells, path, start and finish into one RGB image, one block of pixels per cell
+        Canvas x is the first coordinate of a cell, so the image is the transposed map.
+        :return: (numpy array) (height x width x 3) uint8 image
         """
-        a_stack = queue.LifoQueue()
-        visited = set()
+        size = self.size
+        cells = numpy.empty((size, size), dtype=numpy.uint8)
+        cells[:] = numpy.where(numpy.asarray(self.map) == 0, 0, 1)
+
+        visited = self.solution["Visited cells"]
+        if isinstance(visited, VisitedCells):
+            cells[numpy.asarray(visited.visited[:size * size]).reshape(size, size) & (cells == 0)] = 2
+        elif len(visited):
+            cells[tuple(numpy.array(list(visited)).T)] = 2
+        if len(self.solution["Path"]):
+            cells[tuple(numpy.array(self.solution["Path"]).T)] = 3
+        cells[0, 0] = cells[size - 1, size - 1] = 4
+
+        palette = numpy.array([rgb("#FFFFFF"), rgb("#464646"), rgb(color[1]), rgb(color[0]), rgb("#00FF00")],
+                              dtype=numpy.uint8)
+        image = palette[cells.T]
+
+        # Blow small maps up to whole pixels per cell, with a black outline like the polygons had
+        width = FRAME_WIDTH // size
+        if width >= OUTLINE_MIN_WIDTH:
+            image = image.repeat(width, axis=0).repeat(width, axis=1)
+            image[::width, :] = image[:, ::width] = 0
+        return image
 
-        a_stack.put(self.start_position)
-        visited.add(self.start_position)
+    # Draw map on canvas
+    def draw_map(self, canvas, viewport):
+        if self.image is None:
+            self.image = load_image(self.render())
+            self.image_size = self.image.get_width()
 
-        parent_cell = {}
+        # Blit the part of the cached image inside the viewport, scaled to the canvas
+        scale = self.image_size / self.size
+        canvas.draw_image(self.image,
+                          (viewport.center[0] * scale, viewport.center[1] * scale),
+                          (viewport.span * scale, viewport.span * scale),
+                          (FRAME_WIDTH / 2, FRAME_WIDTH / 2), (FRAME_WIDTH, FRAME_WIDTH))
 
-        while not a_stack.empty():
-            current_cell = a_stack.get()
-            if current_cell == self.end_position:
-                path = self.build_path(parent_cell)
-                return {"Status": "Found Path", "Visited cells": visited,
-                        "No of visited cells": len(visited), "Path": path, "Path length": len(path)}
 
-            for next_cell in self.a_map.connected_cells(current_cell):
-                if next_cell not in visited:
-                    parent_cell[next_cell] = current_cell
-                    visited.add(next_cell)
-                    a_stack.put(next_cell)
+def generate_map():
+    global current_map, planner, viewport
+    if solving:
+        return
+    current_map = Map(int(input_size.get_text()), float(input_probability.get_text()))
+    viewport = Viewport(current_map.size)
+    planner = None
+    update()
 
-        return {"Status": "Path Not Found!!!", "Visited cells": visited,
-                "No of visited cells": len(visited), "Path": [], "Path length": "N/A"}
 
-    def bfs(self):
-        """
-        Find path using Breadth First Search
-        :return: list of status, visited cell, path, and path length
-        """
-        a_queue = queue.Queue()
-        visited = set()
+def draw_handler(canvas):
+    global pending, color
+    if pending is not None:
+        # Show the solution of the solver thread, labels are only touched from here
+        (solution, color, algorithm) = pending
+        pending = None
+        current_map.solution = solution
+        algorithm_used.set_text("Algorithm used: " + algorithm)
+        update()
+    current_map.draw_map(canvas, viewport)
 
-        a_queue.put(self.start_position)
-        visited.add(self.start_position)
 
-        parent_cell = {}
+def input_handler():
+    pass
 
-        while not a_queue.empty():
-            current_cell = a_queue.get()
-            if current_cell == self.end_position:
-                path = self.build_path(parent_cell)
-                return {"Status": "Found Path", "Visited cells": visited,
-                        "No of visited cells": len(visited), "Path": path, "Path length": len(path)}
 
-            for next_cell in self.a_map.connected_cells(current_cell):
-                if next_cell not in visited:
-                    parent_cell[next_cell] = current_cell
-                    visited.add(next_cell)
-                    a_queue.put(next_cell)
+def solve_in_background(algorithm, colors, solve):
+    """
+    Run a solver in a thread so frames keep being drawn, the next frame after it finishes shows the solution
+    :param algorithm: name shown in the UI
+    :param colors: [path color, visited cells color]
+    :param solve: function returning the solution
+    """
+    global solving
+    if solving:
+        return
+    solving = True
+    status_label.set_text("STATUS: Solving with " + algorithm + "...")
 
-        return {"Status": "Path Not Found!!!", "Visited cells": visited,
-                "No of visited cells": len(visited), "Path": [], "Path length": "N/A"}
+    def run():
+        global pending, solving
+        try:
+            pending = (solve(), colors, algorithm)
+        finally:
+            solving = False
 
-    def a_star(self, heuristic):
-        """
-        Find path using A*
-        :param heuristic: "euclidean" or "manhattan"
-        :return: list of status, visited cell, path, and path length
-        """
-        priority_queue = queue.PriorityQueue()
-        visited = set()
-        parent_cell = {}
-        cost_so_far = {}  # Cost from start to each cell
-
-        # Put in que as tuple (priority, cell)
-        priority_queue.put((0, self.start_position))
-        visited.add(self.start_position)
-        cost_so_far[self.start_position] = 0
-
-        while not priority_queue.empty():
-            current_cell = priority_queue.get()
-            # Get the cell only, don't care about priority
-            current_cell = current_cell[1]
-            if current_cell == self.end_position:
-                path = self.build_path(parent_cell)
-                return {"Status": "Found Path", "Visited cells": visited,
-                        "No of visited cells": len(visited), "Path": path, "Path length": len(path)}
-
-            for next_cell in self.a_map.connected_cells(current_cell):
-                new_cost = cost_so_far[current_cell] + 1
-                if next_cell not in visited:
-                    cost_so_far[next_cell] = new_cost
-                    parent_cell[next_cell] = current_cell
-                    visited.add(next_cell)
-
-                    priority = new_cost + self.find_heuristic(next_cell, heuristic)
-                    priority_queue.put((priority, next_cell))
-
-        return {"Status": "Path Not Found!!!", "Visited cells": visited,
-                "No of visited cells": len(visited), "Path": [], "Path length": "N/A"}
-
-    def find_heuristic(self, cell, heuristic):
-        (x1, y1) = cell
-        (x2, y2) = self.end_position
-        if heuristic == "euclidean":
-            return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-        elif heuristic == "manhattan":
-            return abs(x1 - x2) + abs(y1 - y2)
-        elif heuristic == "max":
-            return max(self.find_heuristic(cell, "euclidean"), self.find_heuristic(cell, "manhattan"))
-        elif heuristic == "min":
-            return min(self.find_heuristic(cell, "euclidean"), self.find_heuristic(cell, "manhattan"))
-        elif heuristic == "alpha":
-            alpha = 0.8
-            return alpha*self.find_heuristic(cell, "euclidean") + (1-alpha)*self.find_heuristic(cell, "manhattan")
-        elif heuristic == "beta":
-            beta = 1.8
-            return (abs(x1 - x2)**beta + abs(y1 - y2)**beta)**(1/beta)
+    threading.Thread(target=run, daemon=True).start()
 
 
-def generate_map():
-    global current_map
-    current_map = Map(int(input_size.get_text()), float(input_probability.get_text()))
-    update()
+def mouse_handler(position):
+    # Toggle the clicked cell and repair the path instead of solving again
+    global planner
+    cell = viewport.cell_at(position)
+    if solving or not current_map.in_bounds(cell) or cell in [(0, 0), (current_map.size - 1, current_map.size - 1)]:
+        return
+    if planner is None:
+        planner = IncrementalPlanner(current_map)
+    planner.set_cell(cell[0], cell[1], not current_map.map[cell])
+    solve_in_background("D* Lite", COLOR_LIST[4], planner.plan)
 
 
-def draw_handler(canvas):
-    current_map.draw_map(canvas)
+def key_handler(key):
+    # Arrow keys pan the viewport by a quarter of its width
+    moves = {simplegui.KEY_MAP["left"]: (-0.25, 0), simplegui.KEY_MAP["right"]: (0.25, 0),
+             simplegui.KEY_MAP["up"]: (0, -0.25), simplegui.KEY_MAP["down"]: (0, 0.25)}
+    if key in moves:
+        viewport.pan(*moves[key])
 
 
-def input_handler():
-    pass
+def zoom_in():
+    viewport.zoom_by(2)
+
+
+def zoom_out():
+    viewport.zoom_by(0.5)
 
 
 def solve_with_dfs():
-    global current_map, color
-    color = COLOR_LIST[0]
-    current_map.solution = FindSolution(current_map).dfs()
-    algorithm_used.set_text("Algorithm used: DFS")
-    update()
+    solve_in_background("DFS", COLOR_LIST[0], lambda: FindSolution(current_map).dfs())
 
 
 def solve_with_bfs():
-    global current_map, color
-    color = COLOR_LIST[1]
-    current_map.solution = FindSolution(current_map).bfs()
-    algorithm_used.set_text("Algorithm used: BFS")
-    update()
+    solve_in_background("BFS", COLOR_LIST[1], lambda: FindSolution(current_map).bfs())
 
 
 def solve_with_a_star_euclidean():
-    global current_map, color
-    color = COLOR_LIST[2]
-    current_map.solution = FindSolution(current_map).a_star("euclidean")
-    algorithm_used.set_text("Algorithm used: A* Euclidean")
-    update()
+    solve_in_background("A* Euclidean", COLOR_LIST[2], lambda: FindSolution(current_map).a_star("euclidean"))
 
 
 def solve_with_a_star_manhattan():
-    global current_map, color
-    color = COLOR_LIST[3]
-    current_map.solution = FindSolution(current_map).a_star("manhattan")
-    algorithm_used.set_text("Algorithm used: A* Manhattan")
-    update()
+    solve_in_background("A* Manhattan", COLOR_LIST[3], lambda: FindSolution(current_map).a_star("manhattan"))
 
 
 def update():
@@ -294,30 +281,40 @@ def update():
     no_of_visited_cells_label.set_text("NO OF VISITED CELLS: " + str(current_map.solution["No of visited cells"]))
 
 
-current_map = Map(DEFAULT_SIZE, DEFAULT_PROBABILITY)
-
-# Create frame and control UI
-frame = simplegui.create_frame('Assignment 1', FRAME_WIDTH, FRAME_WIDTH)
-frame.add_button("Generate Map", generate_map, 100)
-frame.set_draw_handler(draw_handler)
-input_size = frame.add_input('Size', input_handler, 50)
-input_size.set_text(str(DEFAULT_SIZE))
-input_probability = frame.add_input("Probability", input_handler, 50)
-input_probability.set_text(str(DEFAULT_PROBABILITY))
-
-# Algorithms
-frame.add_label("")
-frame.add_label("Algorithm")
-frame.add_button("DFS", solve_with_dfs, 100)
-frame.add_button("BFS", solve_with_bfs, 100)
-frame.add_button("A* Euclidean", solve_with_a_star_euclidean, 100)
-frame.add_button("A* Manhattan", solve_with_a_star_manhattan, 100)
-
-# Display status
-frame.add_label("")
-algorithm_used = frame.add_label("Algorithm used: N/A")
-status_label = frame.add_label("STATUS: N/A")
-no_of_visited_cells_label = frame.add_label("NO OF VISITED CELLS: N/A")
-path_length_label = frame.add_label("PATH LENGTH: N/A")
-
-frame.start()
+if __name__ == "__main__":
+    current_map = Map(DEFAULT_SIZE, DEFAULT_PROBABILITY)
+    viewport = Viewport(current_map.size)
+
+    # Create frame and control UI
+    frame = simplegui.create_frame('Assignment 1', FRAME_WIDTH, FRAME_WIDTH)
+    frame.add_button("Generate Map", generate_map, 100)
+    frame.set_draw_handler(draw_handler)
+    frame.set_mouseclick_handler(mouse_handler)
+    frame.set_keydown_handler(key_handler)
+    input_size = frame.add_input('Size', input_handler, 50)
+    input_size.set_text(str(DEFAULT_SIZE))
+    input_probability = frame.add_input("Probability", input_handler, 50)
+    input_probability.set_text(str(DEFAULT_PROBABILITY))
+
+    # Algorithms
+    frame.add_label("")
+    frame.add_label("Algorithm")
+    frame.add_button("DFS", solve_with_dfs, 100)
+    frame.add_button("BFS", solve_with_bfs, 100)
+    frame.add_button("A* Euclidean", solve_with_a_star_euclidean, 100)
+    frame.add_button("A* Manhattan", solve_with_a_star_manhattan, 100)
+
+    # View
+    frame.add_label("")
+    frame.add_label("View (arrow keys to pan)")
+    frame.add_button("Zoom in", zoom_in, 100)
+    frame.add_button("Zoom out", zoom_out, 100)
+
+    # Display status
+    frame.add_label("")
+    algorithm_used = frame.add_label("Algorithm used: N/A")
+    status_label = frame.add_label("STATUS: N/A")
+    no_of_visited_cells_label = frame.add_label("NO OF VISITED CELLS: N/A")
+    path_length_label = frame.add_label("PATH LENGTH: N/A")
+
+    frame.start()
@@ -1,29 +1,194 @@
 # Import Matrix generator module
 import numpy
-import queue
+import collections
+import csv
+import functools
+import heapq
+import itertools
+import json
 import math
+import tempfile
+import time
+import tracemalloc
+
+# Moves to the connected cells, bit i of a neighbor mask is set when DIRECTIONS[i] leads to an empty cell
+DIRECTIONS = [(0, 1), (-1, 0), (0, -1), (1, 0)]
+# Number of random values drawn at once when generating a map
+GENERATION_CHUNK = 2 ** 20
+
+
+def generate_walls(walls, probability, generator):
+    """
+    Fill a uint8 matrix with walls, a chunk of rows at a time so only GENERATION_CHUNK floats exist at once
+    :param walls: (size x size) uint8 array to fill (numpy array or memmap), 1 for walls
+    :param probability: 0.0 - 1.0 (0: all empty cells, 1: all walls)
+    :param generator: numpy.random.Generator
+    """
+    size = walls.shape[1]
+    rows = max(1, GENERATION_CHUNK // size)
+    uniform = numpy.empty((rows, size), dtype=numpy.float32)
+    for first in range(0, walls.shape[0], rows):
+        chunk = uniform[:min(rows, walls.shape[0] - first)]
+        generator.random(out=chunk, dtype=numpy.float32)
+        numpy.less(chunk, probability, out=walls[first:first + len(chunk)].view(numpy.bool_))
+
+
+def fill_neighbor_masks(walls, masks):
+    """
+    Compute the neighbor mask of every cell, a chunk of rows at a time so memmaps are never loaded whole
+    Bit i of a mask is set when the cell at DIRECTIONS[i] is in the map and empty.
+    :param walls: (size x size) matrix, 0 for empty cells
+    :param masks: (size x size) uint8 array to fill (numpy array or memmap)
+    """
+    size = walls.shape[1]
+    rows = max(1, GENERATION_CHUNK // size)
+    for first in range(0, walls.shape[0], rows):
+        last = min(first + rows, walls.shape[0])
+        # One extra row above and below for the vertical neighbors
+        above = max(first - 1, 0)
+        open_cells = (walls[above:last + 1] == 0).view(numpy.uint8)
+        block = numpy.zeros(open_cells.shape, dtype=numpy.uint8)
+        block[:, :-1] |= open_cells[:, 1:]
+        block[1:, :] |= open_cells[:-1, :] << 1
+        block[:, 1:] |= open_cells[:, :-1] << 2
+        block[:-1, :] |= open_cells[1:, :] << 3
+        masks[first:last] = block[first - above:last - above]
+
+
+# Heuristics as vectorized functions of the distances (numpy float32 arrays) along x and y to the goal
+def euclidean(dx, dy):
+    return numpy.sqrt(dx * dx + dy * dy)
+
+
+def manhattan(dx, dy):
+    return dx + dy
+
+
+def alpha_distance(dx, dy, alpha=0.8):
+    return alpha * euclidean(dx, dy) + (1 - alpha) * manhattan(dx, dy)
+
+
+def beta_distance(dx, dy, beta=1.8):
+    return (dx ** beta + dy ** beta) ** (1 / beta)
+
+
+HEURISTICS = {"euclidean": euclidean,
+              "manhattan": manhattan,
+              "max": lambda dx, dy: numpy.maximum(euclidean(dx, dy), manhattan(dx, dy)),
+              "min": lambda dx, dy: numpy.minimum(euclidean(dx, dy), manhattan(dx, dy)),
+              "alpha": alpha_distance,
+              "beta": beta_distance}
+# Bytes of heuristic fields kept by each FieldCache: a field is 4 * size * size bytes, 16 MB at 2000 x 2000 and
+# 400 MB at 10000 x 10000, which is larger than the limit and computed again by every search
+HEURISTIC_CACHE_BYTES = 2 ** 28
+
+
+def register_heuristic(name, function):
+    """
+    Add (or replace) a heuristic usable by the A* solvers
+    :param name: name passed to FindSolution.a_star
+    :param function: vectorized function of (dx, dy), the float32 arrays of distances along x and y to the goal
+    """
+    HEURISTICS[name] = function
+    heuristic_field.cache_clear()
+
+
+class FieldCache:
+    def __init__(self, compute, max_bytes=HEURISTIC_CACHE_BYTES):
+        """
+        Least recently used cache of the fields compute(*key) returns, bounded by their total size in bytes
+        A field larger than max_bytes is returned without being kept.
+        :param compute: function of the key returning a numpy array
+        :param max_bytes: largest total size of the kept fields
+        """
+        self.compute = compute
+        self.max_bytes = max_bytes
+        self.fields = collections.OrderedDict()
+        self.bytes = 0
+
+    def __call__(self, *key):
+        if key in self.fields:
+            self.fields.move_to_end(key)
+            return self.fields[key]
+        field = self.compute(*key)
+        if field.nbytes <= self.max_bytes:
+            self.fields[key] = field
+            self.bytes += field.nbytes
+            while self.bytes > self.max_bytes:
+                (_, dropped) = self.fields.popitem(last=False)
+                self.bytes -= dropped.nbytes
+        return field
+
+    def cache_clear(self):
+        self.fields.clear()
+        self.bytes = 0
+
+
+def heuristic_function(heuristic):
+    """
+    :param heuristic: name of a heuristic in HEURISTICS
+    :return: its vectorized function of (dx, dy)
+    """
+    if heuristic not in HEURISTICS:
+        raise ValueError("unknown heuristic " + repr(heuristic) + ", expected one of " + ", ".join(HEURISTICS))
+    return HEURISTICS[heuristic]
+
+
+def fill_heuristic_field(field, goal, heuristic):
+    """
+    Evaluate a heuristic on every cell, a chunk of rows at a time so memmaps are never loaded whole
+    :param field: (size x size) float32 array to fill (numpy array or memmap)
+    :param goal: (x, y) coordinate of the goal
+    :param heuristic: name of a heuristic in HEURISTICS
+    """
+    function = heuristic_function(heuristic)
+    size = field.shape[1]
+    rows = max(1, GENERATION_CHUNK // size)
+    dy = numpy.abs(numpy.arange(size, dtype=numpy.float32) - goal[1])[None, :]
+    for first in range(0, field.shape[0], rows):
+        dx = numpy.abs(numpy.arange(first, min(first + rows, field.shape[0]), dtype=numpy.float32) - goal[0])
+        field[first:first + len(dx)] = function(dx[:, None], dy)
+
+
+def compute_heuristic_field(size, goal, heuristic):
+    """
+    Heuristic of every cell of a size x size map, computed once per (size, goal, heuristic)
+    :param size: size of the map
+    :param goal: (x, y) coordinate of the goal
+    :param heuristic: name of a heuristic in HEURISTICS
+    :return: (numpy array) flat read-only float32 field, index = x * size + y
+    """
+    field = numpy.empty((size, size), dtype=numpy.float32)
+    fill_heuristic_field(field, goal, heuristic)
+    field.flags.writeable = False
+    return field.reshape(-1)
+
+
+heuristic_field = FieldCache(compute_heuristic_field)
 
 
 class Map:
-    def __init__(self, size, probability):
+    def __init__(self, size, probability, index_neighbors=False, seed=None):
         """Initialize a new map object.
         Args:
             size (int): size of map 10 - 1000
             probability (double): 0.0 - 1.0 (0: all empty cells, 1: all walls)
+            index_neighbors (bool): build the neighbor index now instead of on the first search
+            seed (int or numpy.random.Generator): same seed, same map (random map if None)
         Returns:
-            map object (n*n matrix) with n*n*p empty cells and n*n*(1-p) filled cells
+            map object (n*n uint8 matrix) with n*n*p empty cells and n*n*(1-p) filled cells
         """
         self.size = size
         self.probability = probability
+        self.seed = seed if not isinstance(seed, numpy.random.Generator) else None
 
         # Check if arguments are valid
         if probability > 1 or probability < 0:
             raise ValueError("probability is in range 0 and 1")
 
-        # Generate a uniform distribution matrix (values range from 0.0 to 1.0)
-        self.map = numpy.random.uniform(size=[size, size])
-        # Generate matrix with n*n*p empty cells
-        self.map = (self.map < probability).astype(int)
+        # Generate matrix with n*n*p walls, straight into one byte per cell
+        self.map = numpy.empty((size, size), dtype=numpy.uint8)
+        generate_walls(self.map, probability, numpy.random.default_rng(seed))
 
         # Set start and finish
         self.map[0, 0] = self.map[size - 1, size - 1] = 0
@@ -32,21 +197,141 @@ class Map:
         self.solution = {"Status": "N/A", "Visited cells": [], "No of visited cells": "N/A", "Path": [],
                          "Path length": "N/A"}
 
+        if index_neighbors:
+            self.neighbor_index()
+
+    @classmethod
+    def from_matrix(cls, matrix, probability=None, seed=None):
+        """
+        Make a map object around an existing matrix (numpy array or memmap), without copying it
+        :param matrix: (n*n matrix) 0 for empty cells, 1 for walls
+        :param probability: probability the matrix was generated with, if known
+        :param seed: seed the matrix was generated with, if known
+        :return: map object
+        """
+        a_map = cls.__new__(cls)
+        a_map.size = matrix.shape[0]
+        a_map.probability = probability
+        a_map.seed = seed
+        a_map.map = matrix
+        a_map.solution = {"Status": "N/A", "Visited cells": [], "No of visited cells": "N/A", "Path": [],
+                          "Path length": "N/A"}
+        return a_map
+
+    @property
+    def map(self):
+        return self._map
+
+    @map.setter
+    def map(self, value):
+        # A new matrix makes the neighbor index out of date
+        self._map = value
+        self.neighbor_masks = None
+        self.neighbor_steps = None
+        self.component_labels = None
+
+    def neighbor_index(self):
+        """
+        Build (once) a 4 bit mask per cell of the directions leading to an empty cell
+        Bit i is set when the cell at DIRECTIONS[i] is in the map and empty.
+        Call invalidate_neighbor_index after changing self.map in place, or use set_cell.
+        :return: (memoryview) flat masks, index = x * size + y
+                 (list) neighbor_steps[mask] = tuple of flat index offsets of the connected cells
+        """
+        if self.neighbor_masks is None:
+            masks = numpy.empty((self.size, self.size), dtype=numpy.uint8)
+            fill_neighbor_masks(self.map, masks)
+            self.use_neighbor_masks(masks)
+        return self.neighbor_masks, self.neighbor_steps
+
+    def use_neighbor_masks(self, masks):
+        """
+        Use already computed neighbor masks (e.g. stored in a map file) as the neighbor index
+        :param masks: (size x size) uint8 array or memmap from fill_neighbor_masks
+        """
+        steps = [dx * self.size + dy for (dx, dy) in DIRECTIONS]
+        self.neighbor_masks = memoryview(masks.reshape(-1))
+        self.neighbor_steps = [tuple(steps[i] for i in range(4) if mask >> i & 1) for mask in range(16)]
+
+    def invalidate_neighbor_index(self):
+        self.neighbor_masks = None
+        self.neighbor_steps = None
+        self.component_labels = None
+
+    def component_index(self):
+        """
+        Label (once) the 4-connected components of empty cells, with a vectorized union-find: every round hooks
+        the root of each edge whose ends have different roots onto the smaller one, then compresses the paths
+        :return: (numpy array) flat labels, index = x * size + y, cells of a component share a label, -1 for walls
+        """
+        if self.component_labels is None:
+            open_cells = numpy.asarray(self.map) == 0
+            index_type = numpy.int32 if self.size * self.size < 2 ** 31 else numpy.int64
+            cells = numpy.arange(self.size * self.size, dtype=index_type).reshape(self.size, self.size)
+            # Edges between empty neighbors, to the right and below
+            right = open_cells[:, :-1] & open_cells[:, 1:]
+            below = open_cells[:-1, :] & open_cells[1:, :]
+            first = numpy.concatenate([cells[:, :-1][right], cells[:-1, :][below]])
+            second = numpy.concatenate([cells[:, 1:][right], cells[1:, :][below]])
+
+            parent = cells.reshape(-1).copy()
+            while len(first):
+                (root_first, root_second) = (parent[first], parent[second])
+                different = root_first != root_second
+                (first, second) = (first[different], second[different])
+                (root_first, root_second) = (root_first[different], root_second[different])
+                parent[numpy.maximum(root_first, root_second)] = numpy.minimum(root_first, root_second)
+                while True:
+                    grandparent = parent[parent]
+                    if numpy.array_equal(grandparent, parent):
+                        break
+                    parent = grandparent
+
+            parent[~open_cells.reshape(-1)] = -1
+            self.component_labels = parent
+        return self.component_labels
+
+    def connected(self, cell, other_cell):
+        """
+        Check if there is a path between two cells, in constant time once component_index is built
+        :param cell: (x, y) coordinate of a cell
+        :param other_cell: (x, y) coordinate of the other cell
+        :return: (boolean)
+        """
+        labels = self.component_index()
+        label = labels[cell[0] * self.size + cell[1]]
+        return bool(label >= 0 and label == labels[other_cell[0] * self.size + other_cell[1]])
+
+    def set_cell(self, x, y, blocked):
+        """
+        Change a cell to a wall or an empty cell and patch the neighbor index around it
+        :param x: x coordinate of the cell
+        :param y: y coordinate of the cell
+        :param blocked: (boolean) True for a wall, False for an empty cell
+        """
+        self.map[x, y] = int(blocked)
+        # A new wall may split a component and an empty cell may join some, label them again when needed
+        self.component_labels = None
+        if self.neighbor_masks is not None:
+            for (bit, (dx, dy)) in enumerate(DIRECTIONS):
+                if self.in_bounds((x - dx, y - dy)):
+                    # The neighbor reaches this cell in the same direction
+                    index = (x - dx) * self.size + (y - dy)
+                    if blocked:
+                        self.neighbor_masks[index] &= ~(1 << bit) & 15
+                    else:
+                        self.neighbor_masks[index] |= 1 << bit
+
     def connected_cells(self, cell):
         """
         Find all connected cells around a cell
         :param cell: list of (x, y) coordinate of a cell in a numpy array
         :return:
         """
-        x = cell[0]
-        y = cell[1]
-        connected_cells = set()
-        all_possible_cells = [(x, y + 1), (x - 1, y), (x, y - 1), (x + 1, y)]
-        for (i, j) in all_possible_cells:
-            if self.in_bounds((i, j)):
-                if self.map[i, j] == 0:
-                    connected_cells.add((i, j))
-        return connected_cells
+        (x, y) = cell
+        masks = self.neighbor_index()[0]
+        mask = masks[x * self.size + y]
+        return {(x + dx, y + dy) for (bit, (dx, dy)) in enumerate(DIRECTIONS) if mask >> bit & 1}
 
     def in_bounds(self, cell):
         """
@@ -68,148 +353,1020 @@ class Map:
         print("Path length: " + str(self.solution["Path length"]))
 
 
+class StackFrontier(list):
+    """
+    Last in first out frontier (plain list, no locking like queue.LifoQueue)
+    """
+    put = list.append
+    get = list.pop
+
+
+class QueueFrontier(collections.deque):
+    """
+    First in first out frontier (plain deque, no locking like queue.Queue)
+    """
+    put = collections.deque.append
+    get = collections.deque.popleft
+
+
+class PriorityFrontier(list):
+    """
+    Lowest priority first frontier (heapq on a list, no locking like queue.PriorityQueue)
+    Cells with the same priority come out in the order they were put in
+    """
+    def __init__(self):
+        super().__init__()
+        self.counter = itertools.count()
+
+    def put(self, item, priority):
+        heapq.heappush(self, (priority, next(self.counter), item))
+
+    def get(self):
+        return heapq.heappop(self)[2]
+
+    def top(self):
+        """
+        :return: (priority, item) of the next cell, without removing it
+        """
+        return self[0][0], self[0][2]
+
+
+class VisitedCells:
+    def __init__(self, visited, size, count):
+        """
+        Read-only view of the visited flags of a search, seen as a collection of (x, y) cells
+        :param visited: (numpy array) flat boolean array, index = x * size + y
+        :param size: size of the map
+        :param count: number of visited cells
+        """
+        self.visited = visited
+        self.size = size
+        self.count = count
+
+    def __contains__(self, cell):
+        (x, y) = cell
+        return (0 <= x < self.size) and (0 <= y < self.size) and bool(self.visited[x * self.size + y])
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for index in numpy.flatnonzero(self.visited):
+            yield divmod(int(index), self.size)
+
+
+class SearchStats:
+    # Counters of one search, in the order they are exported
+    FIELDS = ["algorithm", "expanded", "generated", "pushes", "pops", "duplicate pushes", "max frontier",
+              "search wall time", "search cpu time", "build path wall time", "build path cpu time", "peak memory"]
+
+    def __init__(self, algorithm):
+        """
+        Counters and timings of one search, collected when FindSolution is created with stats=True
+        :param algorithm: name of the FindSolution method
+        """
+        self.algorithm = algorithm
+        self.expanded = 0
+        self.pushes = 0
+        self.pops = 0
+        self.max_frontier = 0
+        self.build_path_wall_time = 0.0
+        self.build_path_cpu_time = 0.0
+        self.values = {}
+
+    def record_layer(self, expanded, pushed, frontier_size=None):
+        """
+        Count a whole layer of the layer-at-a-time searches, whose frontiers are arrays or lists
+        :param expanded: number of cells of the layer that was expanded
+        :param pushed: number of cells added to the frontier by the layer
+        :param frontier_size: number of cells in the frontier(s) after the layer, pushed by default
+        """
+        self.pops += expanded
+        self.pushes += pushed
+        self.max_frontier = max(self.max_frontier, pushed if frontier_size is None else frontier_size)
+
+    def finish(self, solution, wall_time, cpu_time, peak_memory):
+        """
+        :return: (dict) the counters of the search, keys in FIELDS
+        """
+        generated = solution["No of visited cells"]
+        self.values = {"algorithm": self.algorithm, "expanded": self.expanded, "generated": generated,
+                       "pushes": self.pushes, "pops": self.pops,
+                       "duplicate pushes": max(0, self.pushes - generated), "max frontier": self.max_frontier,
+                       "search wall time": wall_time - self.build_path_wall_time,
+                       "search cpu time": cpu_time - self.build_path_cpu_time,
+                       "build path wall time": self.build_path_wall_time,
+                       "build path cpu time": self.build_path_cpu_time, "peak memory": peak_memory}
+        return self.values
+
+
+@functools.lru_cache(maxsize=None)
+def counting_frontier(frontier):
+    """
+    Subclass of a frontier class that counts pushes, pops and the largest size into its stats attribute
+    :param frontier: frontier class (StackFrontier, QueueFrontier, PriorityFrontier or alike)
+    :return: frontier class
+    """
+    class CountingFrontier(frontier):
+        stats = None
+
+        def put(self, *item):
+            frontier.put(self, *item)
+            self.stats.pushes += 1
+            if len(self) > self.stats.max_frontier:
+                self.stats.max_frontier = len(self)
+
+        def get(self):
+            self.stats.pops += 1
+            return frontier.get(self)
+
+    CountingFrontier.__name__ = "Counting" + frontier.__name__
+    return CountingFrontier
+
+
+def instrumented(solver):
+    """
+    Time a FindSolution solver into FindSolution.time, and collect its SearchStats when stats are enabled
+    The solution then carries them as "Stats". Nothing is added to the search loops when stats are disabled.
+    """
+    @functools.wraps(solver)
+    def run(self, *args, **kwargs):
+        if not self.collect_stats:
+            start_time = time.perf_counter()
+            solution = solver(self, *args, **kwargs)
+            self.time = time.perf_counter() - start_time
+            return solution
+
+        self.stats = SearchStats(solver.__name__)
+        # Leave tracemalloc running if the caller started it
+        start_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if start_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        start_cpu_time = time.process_time()
+        try:
+            solution = solver(self, *args, **kwargs)
+            self.time = time.perf_counter() - start_time
+            cpu_time = time.process_time() - start_cpu_time
+            peak_memory = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        finally:
+            if start_tracing:
+                tracemalloc.stop()
+        solution["Stats"] = self.stats.finish(solution, self.time, cpu_time, peak_memory)
+        return solution
+    return run
+
+
+def solution_summary(solution):
+    """
+    :return: (dict) status, visited cell count, path length and stats of a solution (without the cells)
+    """
+    summary = {key: solution[key] for key in ["Status", "No of visited cells", "Path length"]}
+    for key in ["Suboptimality bound", "Stats"]:
+        if key in solution:
+            summary[key] = solution[key]
+    return summary
+
+
+def export_stats_json(solutions, path):
+    """
+    Write the summaries of solutions (from solvers run with stats=True) to a JSON file
+    """
+    with open(path, "w") as output:
+        json.dump([solution_summary(solution) for solution in solutions], output, indent=2)
+
+
+def export_stats_csv(solutions, path):
+    """
+    Write one row per solution (from solvers run with stats=True) to a CSV file, columns as in SearchStats.FIELDS
+    """
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(["Status", "No of visited cells", "Path length"] + SearchStats.FIELDS)
+        for solution in solutions:
+            stats = solution.get("Stats", {})
+            writer.writerow([solution["Status"], solution["No of visited cells"], solution["Path length"]] +
+                            [stats.get(field) for field in SearchStats.FIELDS])
+
+
+class Landmarks:
+    def __init__(self, a_map, number=8):
+        """
+        ALT heuristic (A*, landmarks and triangle inequality): exact distances from a few landmark cells, picked
+        far apart in the largest component. For any goal, max over landmarks of |d(L, goal) - d(L, cell)| is a
+        consistent heuristic, and much tighter than the geometric ones on mazes.
+        Pass the object as the heuristic of a_star / bidirectional_a_star. Memory: number * size * size int32.
+        :param a_map: map object
+        :param number: number of landmarks
+        """
+        self.a_map = a_map
+        size = a_map.size
+        labels = a_map.component_index()
+        open_labels = labels[labels >= 0]
+        if len(open_labels) == 0:
+            raise ValueError("the map has no empty cell")
+        largest = numpy.bincount(open_labels).argmax()
+
+        # Farthest point selection: each landmark is the cell farthest from the landmarks so far
+        self.cells = []
+        self.distances = numpy.empty((number, size * size), dtype=numpy.int32)
+        closest = self.distances_from(divmod(int(numpy.flatnonzero(labels == largest)[0]), size))
+        for landmark in range(number):
+            cell = divmod(int(closest.argmax()), size)
+            self.cells.append(cell)
+            self.distances[landmark] = self.distances_from(cell)
+            closest = numpy.minimum(closest, self.distances[landmark])
+        self.heuristic_field = FieldCache(self.compute_field)
+
+    def distances_from(self, cell):
+        """
+        :return: (numpy array) flat BFS distances from a cell to every cell, -1 for cells it does not reach
+        """
+        solver = FindSolution(self.a_map, start_position=cell, end_position=cell)
+        return solver.bfs_vectorized(stop_at_goal=False)["Distances"].reshape(-1).astype(numpy.int32)
+
+    def compute_field(self, goal):
+        """
+        :param goal: (x, y) coordinate of the goal
+        :return: (numpy array) flat read-only float32 field of the heuristic toward the goal
+        """
+        field = numpy.zeros(self.a_map.size * self.a_map.size, dtype=numpy.float32)
+        goal_index = goal[0] * self.a_map.size + goal[1]
+        for distances in self.distances:
+            # Landmarks in another component than the goal say nothing about it
+            if distances[goal_index] >= 0:
+                numpy.maximum(field, numpy.abs(distances - distances[goal_index]), out=field)
+        field.flags.writeable = False
+        return field
+
+    def estimate(self, cell, goal):
+        """
+        Heuristic of one cell toward the goal, the value of the cell in compute_field(goal)
+        """
+        size = self.a_map.size
+        to_goal = self.distances[:, goal[0] * size + goal[1]]
+        to_cell = self.distances[:, cell[0] * size + cell[1]]
+        known = to_goal >= 0
+        return float(numpy.abs(to_cell[known] - to_goal[known]).max(initial=0))
+
+
 class FindSolution:
-    def __init__(self, a_map):
+    def __init__(self, a_map, scratch_directory=None, stats=False, trace_memory=False, on_expand=None,
+                 start_position=(0, 0), end_position=None):
+        """
+        :param a_map: map object
+        :param scratch_directory: keep the per-cell search arrays in temporary memmaps in this directory
+                                  instead of in memory (for maps that are themselves memmapped)
+        :param stats: collect SearchStats for every search, returned in the solution as "Stats"
+        :param trace_memory: with stats, also record the peak memory allocated during the search (tracemalloc,
+                             which slows the search down)
+        :param on_expand: function called with the (x, y) coordinate of every cell the searches expand
+        :param start_position: (x, y) coordinate of the start, an empty cell of the map
+        :param end_position: (x, y) coordinate of the finish, (size - 1, size - 1) by default
+        """
         self.a_map = a_map
+        self.scratch_directory = scratch_directory
+        self.collect_stats = stats
+        self.trace_memory = trace_memory
+        self.on_expand = on_expand
+        self.stats = None
         self.time = 0
         self.result = "N/A"
-        self.start_position = (0, 0)
-        self.end_position = (a_map.size - 1, a_map.size - 1)
+        self.start_position = self.checked_position(start_position, "start")
+        self.end_position = self.checked_position((a_map.size - 1, a_map.size - 1) if end_position is None
+                                                  else end_position, "finish")
 
-    def build_path(self, path_dictionary):
+    def checked_position(self, cell, name):
         """
-        Build a path (list) from a dictionary of parent cell -> child cell
-        :param path_dictionary: (dic) (child.x, child,y) -> (parent.x, parent.y) Child:key, Parent:value
+        A start or finish must be an empty cell of the map: the flat index of a cell out of the map is another cell
+        :param cell: (x, y) coordinate of the cell
+        :param name: "start" or "finish", for the error message
+        :return: (tuple) the cell
+        """
+        cell = tuple(int(value) for value in cell)
+        if not self.a_map.in_bounds(cell):
+            raise ValueError("%s %s is out of the %d x %d map" % (name, cell, self.a_map.size, self.a_map.size))
+        if self.a_map.map[cell]:
+            raise ValueError("%s %s is a wall" % (name, cell))
+        return cell
+
+    def solvable(self):
+        """
+        Check if there is a path from start_position to end_position, without searching (see Map.component_index)
+        :return: (boolean)
+        """
+        return self.a_map.connected(self.start_position, self.end_position)
+
+    def solve_queries(self, queries, algorithm="a_star", *arguments):
+        """
+        Solve many start / finish pairs on the same map. Pairs in different components are answered from the
+        component index without searching, and precomputations such as a Landmarks heuristic are shared.
+        :param queries: list of ((x, y) start, (x, y) finish) pairs, empty cells of the map
+        :param algorithm: name of the solver method
+        :param arguments: arguments of the solver, e.g. a heuristic name or a Landmarks object for a_star
+        :return: list of solutions, in the order of queries
+        """
+        solver = getattr(self, algorithm)
+        queries = [(self.checked_position(start, "start"), self.checked_position(end, "finish"))
+                   for (start, end) in queries]
+        (start_position, end_position) = (self.start_position, self.end_position)
+        unreached = None
+        solutions = []
+        try:
+            for (start, end) in queries:
+                (self.start_position, self.end_position) = (start, end)
+                if self.solvable():
+                    solutions.append(solver(*arguments))
+                else:
+                    if unreached is None:
+                        unreached = numpy.zeros(self.a_map.size * self.a_map.size, dtype=numpy.bool_)
+                    solutions.append(self.path_not_found(unreached, 0))
+        finally:
+            (self.start_position, self.end_position) = (start_position, end_position)
+        return solutions
+
+    def index_of(self, cell):
+        """
+        Convert a cell to its index in the flat search arrays
+        :param cell: (x, y) coordinate of the cell
+        :return: (int) x * size + y
+        """
+        return cell[0] * self.a_map.size + cell[1]
+
+    def connected_indices(self, index):
+        """
+        Find all connected cells around a cell, in the order of DIRECTIONS
+        :param index: flat index of the cell
+        :return: list of flat indices
+        """
+        (masks, steps) = self.a_map.neighbor_index()
+        return [index + step for step in steps[masks[index]]]
+
+    def new_arrays(self, *dtypes):
+        """
+        Preallocate flat per-cell search arrays
+        :param dtypes: "visited" for a boolean array, "index" for parent indices, "cost" for path costs
+        :return: tuple of (numpy array, memoryview) pairs, the memoryview is used in the search loops
+        """
+        number_of_cells = self.a_map.size * self.a_map.size
+        index_type = numpy.int32 if number_of_cells < 2 ** 31 else numpy.int64
+        arrays = []
+        for dtype in dtypes:
+            array_type = numpy.bool_ if dtype == "visited" else index_type
+            if self.scratch_directory is None:
+                array = numpy.zeros(number_of_cells, dtype=array_type)
+            else:
+                # Temporary file, filled with zeros and removed when the array is freed
+                scratch = tempfile.TemporaryFile(dir=self.scratch_directory)
+                array = numpy.memmap(scratch, dtype=array_type, mode="w+", shape=(number_of_cells,))
+            if dtype != "visited":
+                array.fill(-1)
+            arrays.append((array, memoryview(array)))
+        return arrays
+
+    def new_frontier(self, frontier):
+        """
+        :param frontier: frontier class
+        :return: empty frontier, counting into self.stats when stats are enabled
+        """
+        if not self.collect_stats:
+            return frontier()
+        queue = counting_frontier(frontier)()
+        queue.stats = self.stats
+        return queue
+
+    def expansion_hook(self):
+        """
+        :return: function the searches call with the index of every expanded cell, None when nothing listens
+        """
+        if not self.collect_stats and self.on_expand is None:
+            return None
+        (stats, on_expand, size) = (self.stats, self.on_expand, self.a_map.size)
+
+        def expand(index):
+            if stats is not None:
+                stats.expanded += 1
+            if on_expand is not None:
+                on_expand(divmod(index, size))
+        return expand
+
+    def heuristic_field(self, heuristic, goal=None):
+        """
+        Heuristic of every cell toward the goal, shared through the heuristic_field cache, or computed into a
+        temporary memmap when the search arrays live in scratch_directory
+        :param heuristic: name of a heuristic in HEURISTICS, or a Landmarks object
+        :param goal: (x, y) coordinate of the goal, end_position by default
+        :return: (numpy array) flat float32 field, index = x * size + y
+        """
+        goal = tuple(self.end_position if goal is None else goal)
+        size = self.a_map.size
+        if isinstance(heuristic, Landmarks):
+            return heuristic.heuristic_field(goal)
+        if self.scratch_directory is None:
+            return heuristic_field(size, goal, heuristic)
+        scratch = tempfile.TemporaryFile(dir=self.scratch_directory)
+        field = numpy.memmap(scratch, dtype=numpy.float32, mode="w+", shape=(size, size))
+        fill_heuristic_field(field, goal, heuristic)
+        return field.reshape(-1)
+
+    def found_path(self, parent_cell, visited, count, child_cell=None, meeting=None):
+        if not self.collect_stats:
+            path = self.build_path(parent_cell, child_cell, meeting)
+        else:
+            (start_time, start_cpu_time) = (time.perf_counter(), time.process_time())
+            path = self.build_path(parent_cell, child_cell, meeting)
+            self.stats.build_path_wall_time += time.perf_counter() - start_time
+            self.stats.build_path_cpu_time += time.process_time() - start_cpu_time
+        return {"Status": "Found Path", "Visited cells": VisitedCells(visited, self.a_map.size, count),
+                "No of visited cells": count, "Path": path, "Path length": len(path)}
+
+    def path_not_found(self, visited, count):
+        return {"Status": "Path Not Found!!!", "Visited cells": VisitedCells(visited, self.a_map.size, count),
+                "No of visited cells": count, "Path": [], "Path length": "N/A"}
+
+    def build_path(self, parent_cell, child_cell=None, meeting=None):
+        """
+        Build a path (list) from the flat array of parent cells
+        :param parent_cell: (array) parent_cell[child index] = parent index, index = x * size + y
+        :param child_cell: (array) child_cell[index] = next index toward the finish, for bidirectional searches
+        :param meeting: index of the cell where the two searches met, the path follows parent_cell from the start
+                        to it and child_cell from it to the finish
         :return: list of path from start to finish
         """
-        path = []
-        current = path_dictionary[self.end_position]
-        while current != (0, 0):
-            path += (current,)
-            current = path_dictionary[current]
-        return path[::-1]
+        size = self.a_map.size
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        if start == end:
+            return []
+
+        def trace(links, current, stop):
+            cells = []
+            while current != stop:
+                cells.append(divmod(current, size))
+                current = links[current]
+            return cells
 
-    def dfs(self):
+        if meeting is None or meeting == end:
+            return trace(parent_cell, parent_cell[end], start)[::-1]
+        return trace(parent_cell, meeting, start)[::-1] + trace(child_cell, child_cell[meeting], end)
+
+    @instrumented
+    def dfs(self, frontier=StackFrontier):
         """
         Find path using Depth First Search
+        :param frontier: class of the frontier, StackFrontier by default
         :return: list of status, visited cell, path, and path length
         """
-        a_stack = queue.LifoQueue()
-        visited = set()
-
-        a_stack.put(self.start_position)
-        visited.add(self.start_position)
+        (visited, is_visited), (_, parent_cell) = self.new_arrays("visited", "index")
+        (masks, steps) = self.a_map.neighbor_index()
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        a_stack = self.new_frontier(frontier)
+        trace = self.expansion_hook()
 
-        parent_cell = {}
+        a_stack.put(start)
+        is_visited[start] = True
+        count = 1
 
-        while not a_stack.empty():
-            cell = a_stack.get()
-            if cell == self.end_position:
-                path = self.build_path(parent_cell)
-                return {"Status": "Found Path", "Visited cells": visited,
-                        "No of visited cells": len(visited), "Path": path, "Path length": len(path)}
+        while a_stack:
+            current_cell = a_stack.get()
+            if current_cell == end:
+                return self.found_path(parent_cell, visited, count)
+            if trace is not None:
+                trace(current_cell)
 
-            for child in self.a_map.connected_cells(cell):
-                if child not in visited:
-                    parent_cell[child] = cell
-                    visited.add(child)
-                    a_stack.put(child)
+            for step in steps[masks[current_cell]]:
+                next_cell = current_cell + step
+                if not is_visited[next_cell]:
+                    parent_cell[next_cell] = current_cell
+                    is_visited[next_cell] = True
+                    count += 1
+                    a_stack.put(next_cell)
 
-        return {"Status": "Path Not Found!!!", "Visited cells": visited,
-                "No of visited cells": len(visited), "Path": [], "Path length": "N/A"}
+        return self.path_not_found(visited, count)
 
-    def bfs(self):
+    @instrumented
+    def bfs(self, frontier=QueueFrontier):
         """
         Find path using Breadth First Search
+        :param frontier: class of the frontier, QueueFrontier by default
         :return: list of status, visited cell, path, and path length
         """
-        a_queue = queue.Queue()
-        visited = set()
+        (visited, is_visited), (_, parent_cell) = self.new_arrays("visited", "index")
+        (masks, steps) = self.a_map.neighbor_index()
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        a_queue = self.new_frontier(frontier)
+        trace = self.expansion_hook()
 
-        a_queue.put(self.start_position)
-        visited.add(self.start_position)
+        a_queue.put(start)
+        is_visited[start] = True
+        count = 1
 
-        parent_cell = {}
+        while a_queue:
+            current_cell = a_queue.get()
+            if current_cell == end:
+                return self.found_path(parent_cell, visited, count)
+            if trace is not None:
+                trace(current_cell)
 
-        while not a_queue.empty():
-            cell = a_queue.get()
-            if cell == self.end_position:
-                path = self.build_path(parent_cell)
-                return {"Status": "Found Path", "Visited cells": visited,
-                        "No of visited cells": len(visited), "Path": path, "Path length": len(path)}
+            for step in steps[masks[current_cell]]:
+                next_cell = current_cell + step
+                if not is_visited[next_cell]:
+                    parent_cell[next_cell] = current_cell
+                    is_visited[next_cell] = True
+                    count += 1
+                    a_queue.put(next_cell)
 
-            for child in self.a_map.connected_cells(cell):
-                if child not in visited:
-                    parent_cell[child] = cell
-                    visited.add(child)
-                    a_queue.put(child)
+        return self.path_not_found(visited, count)
 
-        return {"Status": "Path Not Found!!!", "Visited cells": visited,
-                "No of visited cells": len(visited), "Path": [], "Path length": "N/A"}
+    @instrumented
+    def bfs_vectorized(self, stop_at_goal=True):
+        """
+        Find path using Breadth First Search, advancing a whole wavefront per step with NumPy
+        Each wavefront is kept in the order bfs puts its cells in the queue, so the result is identical to bfs
+        :param stop_at_goal: False to go on until every reachable cell has its distance
+        :return: list of status, visited cell, path, path length, and "Distances" (size x size matrix of
+                 distances from the start, -1 for cells that were not reached)
+        """
+        size = self.a_map.size
+        masks = numpy.frombuffer(self.a_map.neighbor_index()[0], dtype=numpy.uint8)
+        (visited, _), (parent, parent_cell), (distances, _) = self.new_arrays("visited", "index", "cost")
+        bits = numpy.array([1 << bit for bit in range(len(DIRECTIONS))], dtype=numpy.uint8)
+        steps = numpy.array([dx * size + dy for (dx, dy) in DIRECTIONS], dtype=parent.dtype)
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        trace = self.expansion_hook()
 
-    def a_star(self, heuristic):
-        priority_queue = queue.PriorityQueue()
-        visited = set()
-        parent_cell = {}
-        cost_so_far = {}
+        def expand(cells):
+            # Unvisited cells connected to cells, first discovery only, in the order bfs puts them in the queue
+            connected = numpy.flatnonzero(masks[cells, None] & bits)
+            children = (cells[:, None] + steps).reshape(-1)[connected]
+            unvisited = ~visited[children]
+            (connected, children) = (connected[unvisited], children[unvisited])
+            # Use parent as scratch space: after writing positions in reverse, each cell holds its first position
+            positions = numpy.arange(len(children), dtype=parent.dtype)
+            parent[children[::-1]] = positions[::-1]
+            first = parent[children] == positions
+            if trace is not None:
+                for cell in cells.tolist():
+                    trace(cell)
+            if self.collect_stats:
+                self.stats.record_layer(len(cells), int(first.sum()))
+            return cells[connected[first] // len(DIRECTIONS)], children[first]
 
-        priority_queue.put((0, self.start_position))
-        visited.add(self.start_position)
-        cost_so_far[self.start_position] = 0
+        wavefront = numpy.array([start], dtype=parent.dtype)
+        if self.collect_stats:
+            self.stats.record_layer(0, 1)
+        visited[start] = True
+        distances[start] = 0
+        distance = 0
+        count = 1
 
-        while not priority_queue.empty():
+        while len(wavefront) and not (stop_at_goal and visited[end]):
+            distance += 1
+            (parents, wavefront) = expand(wavefront)
+            parent[wavefront] = parents
+            visited[wavefront] = True
+            distances[wavefront] = distance
+            count += len(wavefront)
+
+        if not visited[end]:
+            solution = self.path_not_found(visited, count)
+        elif not stop_at_goal:
+            solution = self.found_path(parent_cell, visited, count)
+        else:
+            # bfs also expands the cells of the last wavefront that are ahead of the goal in the queue
+            ahead = wavefront[:int(numpy.flatnonzero(wavefront == end)[0])]
+            discovered = expand(ahead)[1]
+            visited[discovered] = True
+            count += len(discovered)
+            solution = self.found_path(parent_cell, visited, count)
+
+        solution["Distances"] = distances.reshape(size, size)
+        return solution
+
+    @instrumented
+    def bidirectional_bfs(self):
+        """
+        Find path using Breadth First Search from both the start and the finish until the two searches meet
+        One whole layer of the smaller side is expanded at a time, and the search stops after the layer where the
+        sides first touch, keeping the shortest connection of that layer, so the path is as short as bfs's.
+        :return: list of status, visited cell, path, and path length
+        """
+        ((visited, is_visited), (_, parent_cell), (_, child_cell),
+         (_, forward_cost), (_, backward_cost)) = self.new_arrays("visited", "index", "index", "cost", "cost")
+        (masks, steps) = self.a_map.neighbor_index()
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+
+        forward = [start]
+        backward = [end]
+        forward_cost[start] = 0
+        backward_cost[end] = 0
+        is_visited[start] = is_visited[end] = True
+        count = 2 if start != end else 1
+        (best, meeting) = (0, start) if start == end else (None, None)
+        trace = self.expansion_hook()
+        if self.collect_stats:
+            self.stats.record_layer(0, count)
+
+        while forward and backward and best is None:
+            # Grow the side with the smaller frontier
+            if len(forward) <= len(backward):
+                (layer, cost, links, other_cost) = (forward, forward_cost, parent_cell, backward_cost)
+            else:
+                (layer, cost, links, other_cost) = (backward, backward_cost, child_cell, forward_cost)
+            next_layer = []
+            for current_cell in layer:
+                if trace is not None:
+                    trace(current_cell)
+                new_cost = cost[current_cell] + 1
+                for step in steps[masks[current_cell]]:
+                    next_cell = current_cell + step
+                    if other_cost[next_cell] >= 0:
+                        if best is None or new_cost + other_cost[next_cell] < best:
+                            (best, meeting, meeting_link) = (new_cost + other_cost[next_cell], next_cell,
+                                                             current_cell)
+                    elif cost[next_cell] < 0:
+                        cost[next_cell] = new_cost
+                        links[next_cell] = current_cell
+                        is_visited[next_cell] = True
+                        count += 1
+                        next_layer.append(next_cell)
+            if self.collect_stats:
+                other_side = backward if layer is forward else forward
+                self.stats.record_layer(len(layer), len(next_layer), len(next_layer) + len(other_side))
+            layer[:] = next_layer
+
+        if best is None:
+            return self.path_not_found(visited, count)
+        if best > 0:
+            # The meeting cell belongs to the other side, link it to the cell of this side that reached it
+            links[meeting] = meeting_link
+        return self.found_path(parent_cell, visited, count, child_cell, meeting)
+
+    @instrumented
+    def a_star(self, heuristic, frontier=PriorityFrontier, weight=1.0):
+        """
+        Find path using (weighted) A*, re-opening cells whenever a cheaper way to them is found
+        With weight > 1 the priority is cost + weight * heuristic, which expands fewer cells and returns a path
+        at most weight times longer than the shortest one (the bound holds for admissible heuristics, which all
+        of HEURISTICS are on a 4-connected map).
+        :param heuristic: "euclidean", "manhattan", "max", "min", "alpha", "beta" or a Landmarks object
+        :param frontier: class of the frontier, PriorityFrontier by default
+        :param weight: weight of the heuristic (epsilon), 1 for plain A*
+        :return: list of status, visited cell, path, path length, and suboptimality bound
+        """
+        ((visited, is_visited), (_, closed), (_, parent_cell),
+         (_, cost_so_far)) = self.new_arrays("visited", "visited", "index", "cost")
+        estimate = memoryview(self.heuristic_field(heuristic))
+        (masks, steps) = self.a_map.neighbor_index()
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        priority_queue = self.new_frontier(frontier)
+        trace = self.expansion_hook()
+
+        priority_queue.put(start, weight * estimate[start])
+        is_visited[start] = True
+        cost_so_far[start] = 0
+        count = 1
+
+        while priority_queue:
             current_cell = priority_queue.get()
-            current_cell = current_cell[1]
-            if current_cell == self.end_position:
-                path = self.build_path(parent_cell)
-                return {"Status": "Found Path", "Visited cells": visited,
-                        "No of visited cells": len(visited), "Path": path, "Path length": len(path)}
+            # Cells are put again when their cost decreases, the older entries are skipped (lazy decrease-key)
+            if closed[current_cell]:
+                continue
+            if current_cell == end:
+                solution = self.found_path(parent_cell, visited, count)
+                solution["Suboptimality bound"] = weight
+                return solution
+            closed[current_cell] = True
+            if trace is not None:
+                trace(current_cell)
 
-            for next_cell in self.a_map.connected_cells(current_cell):
-                new_cost = cost_so_far[current_cell] + 1
-                if next_cell not in visited:  # or new_cost < cost_so_far[next_cell]:
+            new_cost = cost_so_far[current_cell] + 1
+            for step in steps[masks[current_cell]]:
+                next_cell = current_cell + step
+                if not is_visited[next_cell] or new_cost < cost_so_far[next_cell]:
+                    if not is_visited[next_cell]:
+                        is_visited[next_cell] = True
+                        count += 1
                     cost_so_far[next_cell] = new_cost
                     parent_cell[next_cell] = current_cell
-                    visited.add(next_cell)
-
-                    priority = new_cost + self.find_heuristic(next_cell, heuristic)
-                    priority_queue.put((priority, next_cell))
-
-        return {"Status": "Path Not Found!!!", "Visited cells": visited,
-                "No of visited cells": len(visited), "Path": [], "Path length": "N/A"}
-
-    def find_heuristic(self, cell, heuristic):
-        (x1, y1) = cell
-        (x2, y2) = self.end_position
-        if heuristic == "euclidean":
-            return math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-        elif heuristic == "manhattan":
-            return abs(x1 - x2) + abs(y1 - y2)
-        elif heuristic == "max":
-            return max(self.find_heuristic(cell, "euclidean"), self.find_heuristic(cell, "manhattan"))
-        elif heuristic == "min":
-            return min(self.find_heuristic(cell, "euclidean"), self.find_heuristic(cell, "manhattan"))
-        elif heuristic == "alpha":
-            alpha = 0.8
-            return alpha*self.find_heuristic(cell, "euclidean") + (1-alpha)*self.find_heuristic(cell, "manhattan")
-        elif heuristic == "beta":
-            beta = 1.8
-            return (abs(x1 - x2)**beta + abs(y1 - y2)**beta)**(1/beta)
-
-current_map = Map(2000, 0.2)
-
-print("--------------------------------\nUsing DFS")
-current_map.solution = FindSolution(current_map).dfs()
-current_map.print_solution()
-print("--------------------------------\nUsing BFS")
-current_map.solution = FindSolution(current_map).bfs()
-current_map.print_solution()
-print("--------------------------------\nUsing A* Euclidean")
-current_map.solution = FindSolution(current_map).a_star("euclidean")
-current_map.print_solution()
-print("--------------------------------\nUsing A* Manhattan")
-current_map.solution = FindSolution(current_map).a_star("manhattan")
-current_map.print_solution()
+                    closed[next_cell] = False
+                    priority_queue.put(next_cell, new_cost + weight * estimate[next_cell])
+
+        return self.path_not_found(visited, count)
+
+    @instrumented
+    def ara_star(self, heuristic, time_budget=1.0, weight=3.0, decrement=0.5, frontier=PriorityFrontier):
+        """
+        Find path using Anytime Repairing A* (ARA*)
+        A first path is found quickly with weighted A*, then the weight is lowered step by step toward 1 and the
+        path is improved, reusing the costs of the previous searches, until the time budget runs out or the
+        path is shown to be the shortest. The first path is always returned, even past the time budget.
+        :param heuristic: "euclidean", "manhattan", "max", "min", "alpha", "beta" or a Landmarks object
+        :param time_budget: seconds to spend improving the path
+        :param weight: weight of the heuristic (epsilon) of the first search
+        :param decrement: how much the weight is lowered after each search
+        :param frontier: class of the frontier, PriorityFrontier by default
+        :return: list of status, visited cell, path, path length, suboptimality bound (path length is at most
+                 that many times the shortest one) and "Improvements" (weight, bound, path length and time of each
+                 published path)
+        """
+        ((visited, is_visited), (opened, is_open), (closed_cells, closed), (inconsistent, is_inconsistent),
+         (cost, cost_so_far), (_, parent_cell)) = self.new_arrays("visited", "visited", "visited", "visited",
+                                                                  "cost", "index")
+        field = self.heuristic_field(heuristic)
+        estimate = memoryview(field)
+        (masks, steps) = self.a_map.neighbor_index()
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        start_time = time.perf_counter()
+        deadline = start_time + time_budget
+        trace = self.expansion_hook()
+        count = 1
+
+        def improve_path(priority_queue, weight, interruptible):
+            # Weighted A* that stops once no cell in the frontier can lead to a cheaper goal
+            nonlocal count
+            expansions = 0
+            while priority_queue:
+                (priority, current_cell) = priority_queue.top()
+                if not is_open[current_cell] or priority != cost_so_far[current_cell] + weight * estimate[current_cell]:
+                    priority_queue.get()
+                    continue
+                if is_visited[end] and cost_so_far[end] <= priority:
+                    return True
+                expansions += 1
+                if interruptible and expansions % 1024 == 0 and time.perf_counter() > deadline:
+                    return False
+
+                priority_queue.get()
+                is_open[current_cell] = False
+                closed[current_cell] = True
+                if trace is not None:
+                    trace(current_cell)
+                new_cost = cost_so_far[current_cell] + 1
+                for step in steps[masks[current_cell]]:
+                    next_cell = current_cell + step
+                    if not is_visited[next_cell] or new_cost < cost_so_far[next_cell]:
+                        if not is_visited[next_cell]:
+                            is_visited[next_cell] = True
+                            count += 1
+                        cost_so_far[next_cell] = new_cost
+                        parent_cell[next_cell] = current_cell
+                        if not closed[next_cell]:
+                            is_open[next_cell] = True
+                            priority_queue.put(next_cell, new_cost + weight * estimate[next_cell])
+                        elif not is_inconsistent[next_cell]:
+                            # Closed in this search, it is put back in the frontier of the next one
+                            is_inconsistent[next_cell] = True
+            return True
+
+        def bound(weight):
+            # The shortest path is at least the lowest cost + heuristic among the cells still to be expanded
+            pending = numpy.flatnonzero(opened | inconsistent)
+            if len(pending) == 0:
+                return 1.0
+            lowest = float((cost[pending] + field[pending]).min())
+            if lowest <= 0:
+                # Only the start can have a lower bound of 0, when it is the goal
+                return 1.0
+            return min(weight, max(1.0, cost_so_far[end] / lowest))
+
+        priority_queue = self.new_frontier(frontier)
+        priority_queue.put(start, weight * estimate[start])
+        is_visited[start] = is_open[start] = True
+        cost_so_far[start] = 0
+
+        improve_path(priority_queue, weight, interruptible=False)
+        if not is_visited[end]:
+            return self.path_not_found(visited, count)
+        solution = self.found_path(parent_cell, visited, count)
+        suboptimality = bound(weight)
+        improvements = [{"Weight": weight, "Suboptimality bound": suboptimality,
+                         "Path length": solution["Path length"], "Time": time.perf_counter() - start_time}]
+
+        while suboptimality > 1 and time.perf_counter() < deadline:
+            weight = max(1.0, weight - decrement)
+            # Next frontier: the open and inconsistent cells, with the new weight, and nothing closed
+            opened |= inconsistent
+            inconsistent[:] = False
+            closed_cells[:] = False
+            priority_queue = self.new_frontier(frontier)
+            for cell in numpy.flatnonzero(opened).tolist():
+                priority_queue.put(cell, cost_so_far[cell] + weight * estimate[cell])
+            if not improve_path(priority_queue, weight, interruptible=True):
+                break
+            solution = self.found_path(parent_cell, visited, count)
+            suboptimality = bound(weight)
+            improvements.append({"Weight": weight, "Suboptimality bound": suboptimality,
+                                 "Path length": solution["Path length"], "Time": time.perf_counter() - start_time})
+
+        solution["Suboptimality bound"] = suboptimality
+        solution["Improvements"] = improvements
+        return solution
+
+    @instrumented
+    def bidirectional_a_star(self, heuristic, frontier=PriorityFrontier):
+        """
+        Find path using A* from both the start and the finish until the two searches meet
+        Both sides use the balanced potential (h(cell, finish) - h(cell, start)) / 2, which keeps the two searches
+        consistent with each other, and stop when the best keys of the two frontiers add up to the best connection.
+        :param heuristic: "euclidean", "manhattan", "max", "min", "alpha", "beta" or a Landmarks object
+        :param frontier: class of the frontier, PriorityFrontier by default
+        :return: list of status, visited cell, path, and path length
+        """
+        ((visited, is_visited), (_, forward_closed), (_, backward_closed), (_, parent_cell), (_, child_cell),
+         (_, forward_cost), (_, backward_cost)) = self.new_arrays("visited", "visited", "visited", "index", "index",
+                                                                  "cost", "cost")
+        (masks, steps) = self.a_map.neighbor_index()
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+        to_end = self.heuristic_field(heuristic)
+        to_start = self.heuristic_field(heuristic, self.start_position)
+        potential = memoryview((to_end - to_start) / 2)
+
+        forward = self.new_frontier(frontier)
+        backward = self.new_frontier(frontier)
+        trace = self.expansion_hook()
+        forward.put(start, potential[start])
+        backward.put(end, -potential[end])
+        forward_cost[start] = 0
+        backward_cost[end] = 0
+        is_visited[start] = is_visited[end] = True
+        count = 2 if start != end else 1
+        (best, meeting) = (0, start) if start == end else (math.inf, None)
+
+        sides = [(forward, forward_closed, forward_cost, parent_cell, backward_cost, 1),
+                 (backward, backward_closed, backward_cost, child_cell, forward_cost, -1)]
+        while True:
+            # Drop the cells that were already expanded with a lower cost (lazy deletion)
+            for (queue, closed) in [(forward, forward_closed), (backward, backward_closed)]:
+                while queue and closed[queue.top()[1]]:
+                    queue.get()
+            if not forward or not backward or forward.top()[0] + backward.top()[0] >= best:
+                break
+
+            # Expand the side with the smaller frontier
+            (queue, closed, cost, links, other_cost, sign) = sides[len(backward) < len(forward)]
+            current_cell = queue.get()
+            closed[current_cell] = True
+            if trace is not None:
+                trace(current_cell)
+            new_cost = cost[current_cell] + 1
+            for step in steps[masks[current_cell]]:
+                next_cell = current_cell + step
+                if cost[next_cell] < 0 or new_cost < cost[next_cell]:
+                    if cost[next_cell] < 0 and other_cost[next_cell] < 0:
+                        is_visited[next_cell] = True
+                        count += 1
+                    cost[next_cell] = new_cost
+                    links[next_cell] = current_cell
+                    closed[next_cell] = False
+                    queue.put(next_cell, new_cost + sign * potential[next_cell])
+                if other_cost[next_cell] >= 0 and cost[next_cell] + other_cost[next_cell] < best:
+                    (best, meeting) = (cost[next_cell] + other_cost[next_cell], next_cell)
+
+        if meeting is None:
+            return self.path_not_found(visited, count)
+        return self.found_path(parent_cell, visited, count, child_cell, meeting)
+
+    @instrumented
+    def jps(self, frontier=PriorityFrontier):
+        """
+        Find path using Jump Point Search (A* with Manhattan distance over jump points only)
+        On a 4-connected grid every shortest path can be reordered so that it only turns from a horizontal move
+        (along y) into a vertical move (along x) where the cell behind has a wall on that side. Horizontal jumps
+        stop at such forced cells, vertical jumps stop where a horizontal jump from them finds something, and
+        only the stops are put in the frontier. The path length is the same as bfs's.
+        :param frontier: class of the frontier, PriorityFrontier by default
+        :return: list of status, visited cell (the jump points), path, and path length
+        """
+        ((visited, is_visited), (_, closed), (_, parent_cell), (_, jump_parent), (_, cost_so_far),
+         (_, direction)) = self.new_arrays("visited", "visited", "index", "index", "cost", "index")
+        size = self.a_map.size
+        masks = self.a_map.neighbor_index()[0]
+        heuristic = memoryview(self.heuristic_field("manhattan"))
+        offsets = [dx * size + dy for (dx, dy) in DIRECTIONS]
+        (horizontal, vertical) = ((0, 2), (1, 3))
+        forced_bits = (1 << 1) | (1 << 3)
+        start = self.index_of(self.start_position)
+        end = self.index_of(self.end_position)
+
+        def jump_horizontal(cell, bit):
+            step = offsets[bit]
+            while masks[cell] >> bit & 1:
+                cell += step
+                # Stop at the goal and where a vertical move opens up that was walled one cell back
+                if cell == end or masks[cell] & ~masks[cell - step] & forced_bits:
+                    return cell
+            return None
+
+        def jump_vertical(cell, bit):
+            step = offsets[bit]
+            while masks[cell] >> bit & 1:
+                cell += step
+                if cell == end or jump_horizontal(cell, 0) is not None or jump_horizontal(cell, 2) is not None:
+                    return cell
+            return None
+
+        def successors(cell):
+            # Directions worth jumping in, given the direction the cell was reached in
+            arrived = direction[cell]
+            if arrived < 0:
+                return range(len(DIRECTIONS))
+            if arrived in vertical:
+                return (arrived,) + horizontal
+            behind = masks[cell - offsets[arrived]]
+            return (arrived,) + tuple(bit for bit in vertical if masks[cell] >> bit & 1 and not behind >> bit & 1)
+
+        priority_queue = self.new_frontier(frontier)
+        trace = self.expansion_hook()
+        priority_queue.put(start, heuristic[start])
+        is_visited[start] = True
+        cost_so_far[start] = 0
+        count = 1
+
+        while priority_queue:
+            current_cell = priority_queue.get()
+            if closed[current_cell]:
+                continue
+            if current_cell == end:
+                # Fill in the cells between consecutive jump points
+                while current_cell != start:
+                    previous = jump_parent[current_cell]
+                    step = offsets[direction[current_cell]]
+                    for cell in range(previous + step, current_cell + step, step):
+                        parent_cell[cell] = cell - step
+                    current_cell = previous
+                return self.found_path(parent_cell, visited, count)
+            closed[current_cell] = True
+            if trace is not None:
+                trace(current_cell)
+
+            for bit in successors(current_cell):
+                if not masks[current_cell] >> bit & 1:
+                    continue
+                if bit in horizontal:
+                    next_cell = jump_horizontal(current_cell, bit)
+                else:
+                    next_cell = jump_vertical(current_cell, bit)
+                if next_cell is None:
+                    continue
+                distance = abs(next_cell - current_cell) // abs(offsets[bit])
+                new_cost = cost_so_far[current_cell] + distance
+                if cost_so_far[next_cell] < 0 or new_cost < cost_so_far[next_cell]:
+                    if not is_visited[next_cell]:
+                        is_visited[next_cell] = True
+                        count += 1
+                    cost_so_far[next_cell] = new_cost
+                    jump_parent[next_cell] = current_cell
+                    direction[next_cell] = bit
+                    closed[next_cell] = False
+                    priority_queue.put(next_cell, new_cost + heuristic[next_cell])
+
+        return self.path_not_found(visited, count)
+
+    def find_heuristic(self, cell, heuristic, goal=None):
+        """
+        Estimate the distance from a cell to the goal (end_position by default), the value of the cell in the
+        heuristic field (up to float32 rounding) without computing the field
+        """
+        goal = tuple(self.end_position if goal is None else goal)
+        if isinstance(heuristic, Landmarks):
+            return heuristic.estimate(cell, goal)
+        (dx, dy) = (numpy.float32(abs(cell[0] - goal[0])), numpy.float32(abs(cell[1] - goal[1])))
+        return float(heuristic_function(heuristic)(dx, dy))
+
+if __name__ == "__main__":
+    current_map = Map(2000, 0.2)
+
+    print("--------------------------------\nUsing DFS")
+    current_map.solution = FindSolution(current_map).dfs()
+    current_map.print_solution()
+    print("--------------------------------\nUsing BFS")
+    current_map.solution = FindSolution(current_map).bfs()
+    current_map.print_solution()
+    print("--------------------------------\nUsing A* Euclidean")
+    current_map.solution = FindSolution(current_map).a_star("euclidean")
+    current_map.print_solution()
+    print("--------------------------------\nUsing A* Manhattan")
+    current_map.solution = FindSolution(current_map).a_star("manhattan")
+    current_map.print_solution()
+    print("--------------------------------\nUsing Bidirectional BFS")
+    current_map.solution = FindSolution(current_map).bidirectional_bfs()
+    current_map.print_solution()
+    print("--------------------------------\nUsing Bidirectional A* Manhattan")
+    current_map.solution = FindSolution(current_map).bidirectional_a_star("manhattan")
+    current_map.print_solution()
+    print("--------------------------------\nUsing Jump Point Search")
+    current_map.solution = FindSolution(current_map).jps()
+    current_map.print_solution()
 
 # Question 8
 # print("Using Max Distance")
@@ -0,0 +1,67 @@
+import numpy
+import pytest
+
+from MapSearchNoGUI import Map, FindSolution, FieldCache, Landmarks, HEURISTICS
+
+
+def open_map(size):
+    return Map.from_matrix(numpy.zeros((size, size), dtype=numpy.uint8))
+
+
+@pytest.mark.parametrize("position", [(0, 10), (10, 0), (-1, 0), (3, -1)])
+def test_endpoint_out_of_bounds_is_rejected(position):
+    a_map = open_map(10)
+    with pytest.raises(ValueError, match="out of"):
+        FindSolution(a_map, start_position=position)
+    with pytest.raises(ValueError, match="out of"):
+        FindSolution(a_map, end_position=position)
+    with pytest.raises(ValueError, match="out of"):
+        FindSolution(a_map).solve_queries([((0, 0), position)], "bfs")
+
+
+def test_endpoint_on_a_wall_is_rejected():
+    a_map = open_map(10)
+    a_map.map[4, 5] = 1
+    with pytest.raises(ValueError, match="wall"):
+        FindSolution(a_map, start_position=(4, 5))
+    with pytest.raises(ValueError, match="wall"):
+        FindSolution(a_map, end_position=(4, 5))
+    with pytest.raises(ValueError, match="wall"):
+        FindSolution(a_map).solve_queries([((4, 5), (9, 9))], "bfs")
+
+
+def test_valid_endpoints_agree_with_solvable():
+    a_map = Map(50, 0.2, seed=1)
+    solver = FindSolution(a_map, start_position=(0, 0), end_position=(49, 49))
+    assert (solver.bfs()["Status"] == "Found Path") == solver.solvable()
+
+
+def test_bfs_vectorized_in_scratch_directory(tmp_path):
+    a_map = Map(60, 0.25, seed=4)
+    in_memory = FindSolution(a_map).bfs_vectorized(stop_at_goal=False)
+    scratch = FindSolution(a_map, scratch_directory=str(tmp_path)).bfs_vectorized(stop_at_goal=False)
+    assert isinstance(scratch["Distances"].base, numpy.memmap)
+    assert numpy.array_equal(scratch["Distances"], in_memory["Distances"])
+    assert scratch["Path"] == in_memory["Path"]
+
+
+@pytest.mark.parametrize("heuristic", list(HEURISTICS) + ["landmarks"])
+def test_find_heuristic_matches_the_field(heuristic):
+    a_map = Map(40, 0.2, seed=5)
+    if heuristic == "landmarks":
+        heuristic = Landmarks(a_map, number=4)
+    solver = FindSolution(a_map)
+    field = solver.heuristic_field(heuristic)
+    for cell in [(0, 0), (3, 17), (39, 0), (39, 39)]:
+        # The vectorized powers of "beta" may round the last bit differently
+        assert solver.find_heuristic(cell, heuristic) == pytest.approx(float(field[solver.index_of(cell)]), rel=1e-6)
+
+
+def test_field_cache_is_bounded_in_bytes():
+    cache = FieldCache(lambda size: numpy.zeros(size, dtype=numpy.float32), max_bytes=1000)
+    for size in [100, 100, 50, 200, 300]:
+        cache(size)
+    assert cache.bytes <= 1000
+    assert list(cache.fields) == [(50,), (200,)]
+    cache(400)
+    assert (400,) not in cache.fields
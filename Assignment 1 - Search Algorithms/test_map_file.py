@@ -0,0 +1,18 @@
+import numpy
+
+from MapFile import create_map_file, open_map, save_map
+from MapSearchNoGUI import Map
+
+
+def test_numpy_integer_seed_is_stored(tmp_path):
+    path = str(tmp_path / "seeded.map")
+    create_map_file(path, 20, 0.3, seed=numpy.int64(7))
+    a_map = open_map(path)
+    assert a_map.seed == 7
+    assert numpy.array_equal(a_map.map, Map(20, 0.3, seed=7).map)
+
+
+def test_unknown_seed_reads_back_as_none(tmp_path):
+    path = str(tmp_path / "unseeded.map")
+    save_map(path, Map(20, 0.3, seed=numpy.random.default_rng(1)))
+    assert open_map(path).seed is None
@@ -1,24 +1,174 @@
-import numpy as np
+import heapq
 import random
 
+import numpy as np
+
 SIZE = 5
+TERRAINS = ["flat", "hilly", "forested", "caves"]
+# P(Target not found in Cell | Target is in Cell) of each terrain
+FALSE_NEGATIVE_RATES = np.array([0.2, 0.4, 0.6, 0.9], dtype=np.float64)
+RULES = ["containing", "finding"]
+# The normalizer is summed again when it shrinks this much, before subtracting from it loses precision
+RESUM_FACTOR = 1e-6
+# The weights are scaled up when the normalizer gets this small, before they underflow
+RESCALE_BELOW = 1e-200
+
 
 class MazeSearch:
-    def __init__(self):
-        self.maze = np.zeros((SIZE, SIZE), dtype=np.float64)
-        for i in range(0, SIZE):
-            for j in range(0, SIZE):
-                self.maze[i,j] = random.choice([0.2, 0.4, 0.6, 0.9])
+    def __init__(self, size=SIZE, seed=None):
+        """
+        Landscape of size x size cells of random terrain, with a target hidden in one of them
+        :param size: size of the landscape
+        :param seed: seed of the random generator (random landscape if None)
+        """
+        self.size = size
+        generator = np.random.default_rng(seed)
+        self.terrain = generator.integers(len(TERRAINS), size=(size, size), dtype=np.int8)
+        self.maze = FALSE_NEGATIVE_RATES[self.terrain]
+        # Searches draw from a Python generator, a numpy draw per search costs more than the belief update
+        self.random = random.Random(int(generator.integers(2 ** 63)))
+        self.target = None
+        self.move_target()
+        self.reset_belief()
+
+    def move_target(self):
+        """
+        Hide the target in a new cell, chosen uniformly
+        """
+        self.target = self.random.randrange(self.size * self.size)
+
+    def reset_belief(self):
+        """
+        Go back to the prior belief, every cell equally likely to contain the target
+        The belief is kept unnormalized: P(Target in Cell i) = weight[i] / normalizer. A failed search then only
+        changes the weight of one cell and the normalizer.
+        """
+        number_of_cells = self.size * self.size
+        self.containing_weight = np.ones(number_of_cells, dtype=np.float64)
+        # P(Target found in Cell i) = P(Target in Cell i) * (1 - false negative rate of Cell i)
+        self.finding_weight = 1 - self.maze.reshape(-1)
+        self.normalizer = float(number_of_cells)
+        self.summed_normalizer = self.normalizer
+        (self.containing_view, self.finding_view) = (memoryview(self.containing_weight),
+                                                     memoryview(self.finding_weight))
+        self.false_negative_view = memoryview(self.maze.reshape(-1))
+        # Max-heaps of the cells by weight, built on the first use of a rule
+        self.heaps = {}
+        self.searches = 0
+
+    @property
+    def probability_containing(self):
+        # P(Target in Cell | Observations)
+        return (self.containing_weight / self.normalizer).reshape(self.size, self.size)
+
+    @property
+    def probability_finding(self):
+        # P(Target found in Cell | Observations)
+        return (self.finding_weight / self.normalizer).reshape(self.size, self.size)
+
+    def weights(self, rule):
+        return self.containing_view if rule == "containing" else self.finding_view
 
-        self.probability_containing = np.full((SIZE, SIZE), 1/(SIZE*SIZE), dtype=np.float64)
-        self.probability_finding = self.probability_containing
+    def heap(self, rule):
+        """
+        Max-heap of (-weight, cell) of a rule. An entry is current while its weight is the weight of its cell,
+        the weights of the other entries of the cell are older, larger, and are dropped when they reach the top.
+        """
+        if rule not in self.heaps:
+            if rule not in RULES:
+                raise ValueError("rule is one of " + ", ".join(RULES))
+            weights = self.weights(rule)
+            self.heaps[rule] = [(-weights[cell], cell) for cell in range(len(weights))]
+            heapq.heapify(self.heaps[rule])
+        return self.heaps[rule]
+
+    def next_cell(self, rule="containing"):
+        """
+        Cell with the highest probability of containing (or of finding) the target, ties broken by cell index
+        :param rule: "containing" or "finding"
+        :return: flat index of the cell, index = x * size + y
+        """
+        heap = self.heap(rule)
+        weights = self.weights(rule)
+        while -heap[0][0] != weights[heap[0][1]]:
+            heapq.heappop(heap)
+        return heap[0][1]
+
+    def search(self, cell):
+        """
+        Search a cell, and update the belief if the target is not found
+        :param cell: flat index of the cell, index = x * size + y
+        :return: (boolean) True if the target was found
+        """
+        self.searches += 1
+        false_negative_rate = self.false_negative_view[cell]
+        if cell == self.target and self.random.random() >= false_negative_rate:
+            return True
+        self.fail(cell, false_negative_rate)
+        return False
+
+    def fail(self, cell, false_negative_rate):
+        """
+        Bayes update after a failed search of a cell, in O(log n) for the heaps and O(1) for the belief:
+        P(Target in Cell i | Failure in Cell j) = P(Target in Cell i) * P(Failure in Cell j | Target in Cell i)
+        / P(Failure in Cell j), so only weight[j] is multiplied by the false negative rate of j, and dividing by
+        P(Failure in Cell j) is left to the normalizer.
+        """
+        old_weight = self.containing_view[cell]
+        weight = old_weight * false_negative_rate
+        self.containing_view[cell] = weight
+        self.finding_view[cell] = weight * (1 - false_negative_rate)
+        self.normalizer -= old_weight - weight
+
+        for (rule, heap) in self.heaps.items():
+            entry = (-self.weights(rule)[cell], cell)
+            if heap[0][1] == cell:
+                # The searched cell is usually the top of the heap of the rule, its weight only went down
+                heapq.heapreplace(heap, entry)
+            else:
+                heapq.heappush(heap, entry)
+
+        if self.normalizer < self.summed_normalizer * RESUM_FACTOR:
+            self.renormalize()
+
+    def renormalize(self):
+        """
+        Sum the weights again (the normalizer drifts as it is only ever subtracted from), and scale them up if
+        they are getting too small. Happens once every time the normalizer shrinks by RESUM_FACTOR.
+        """
+        self.normalizer = float(self.containing_weight.sum())
+        if self.normalizer < RESCALE_BELOW:
+            scale = 1 / self.normalizer
+            self.containing_weight *= scale
+            self.finding_weight *= scale
+            self.normalizer = float(self.containing_weight.sum())
+            # The keys of the heaps are weights, build them again
+            self.heaps = {}
+        self.summed_normalizer = self.normalizer
+
+    def locate(self, rule="containing", max_searches=None):
+        """
+        Search the cell chosen by a rule until the target is found
+        :param rule: "containing" (Rule 1) or "finding" (Rule 2)
+        :param max_searches: give up after this many searches (never if None)
+        :return: number of searches, None if max_searches was reached
+        """
+        (first_search, search, next_cell) = (self.searches, self.search, self.next_cell)
+        while max_searches is None or self.searches - first_search < max_searches:
+            if search(next_cell(rule)):
+                return self.searches - first_search
+        return None
 
     def print(self):
         print("Maze\n")
         print(self.maze)
         print("\n\nProbability containing target\n")
+        print(self.probability_containing)
+        print("\n\nProbability finding target\n")
         print(self.probability_finding)
-        print("\n\nProbability finding target\n" + self.probability_finding + "\n\n")
+        print("\n")
+
 
-myMaze = MazeSearch()
-myMaze.print()
\ No newline at end of file
+if __name__ == "__main__":
+    myMaze = MazeSearch()
+    myMaze.print()
@@ -0,0 +1,182 @@
+# Monte Carlo comparison of search policies: many landscapes searched in lockstep as stacked arrays, with the
+# trials sharded over a process pool
+import argparse
+import concurrent.futures
+import json
+import os
+
+import numpy as np
+
+from MazeSearch import TERRAINS, FALSE_NEGATIVE_RATES
+
+# Cell searched next by each policy: the highest probability of containing or of finding the target, or that
+# probability divided by 1 + the distance to travel to the cell
+POLICIES = ["containing", "finding", "containing distance", "finding distance"]
+DEFAULT_SIZE = 50
+# Finished runs stay in the arrays (masked out) until this fraction of them is finished, then the arrays shrink
+COMPACT_FRACTION = 0.25
+RESCALE_EVERY = 64
+RESCALE_BELOW = 1e-200
+
+
+def simulate(policy, size, trials, seed, max_searches=None):
+    """
+    Run independent trials of a policy, all advancing one search per step
+    Each trial has its own random landscape, target and start cell. The belief of every trial is a row of an
+    unnormalized weight array, a failed search multiplies the weight of the searched cell by its false negative
+    rate (the normalization of Bayes' rule does not change which cell is best).
+    :param policy: one of POLICIES
+    :param size: size of the landscapes
+    :param trials: number of trials
+    :param seed: (int or numpy.random.SeedSequence) same seed, same landscapes, targets and start cells for every
+                 policy, so policies are compared on the same trials
+    :param max_searches: stop the trials that have not found their target after this many searches
+    :return: number of searches (-1 if stopped) and travel distance of each trial
+    """
+    if policy not in POLICIES:
+        raise ValueError("policy is one of " + ", ".join(POLICIES))
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    (landscape_seed, search_seed) = seed.spawn(2)
+    landscapes = np.random.default_rng(landscape_seed)
+    number_of_cells = size * size
+    false_negative = FALSE_NEGATIVE_RATES[landscapes.integers(len(TERRAINS), size=(trials, number_of_cells))]
+    target = landscapes.integers(number_of_cells, size=trials)
+    position = landscapes.integers(number_of_cells, size=trials)
+    generator = np.random.default_rng(search_seed)
+
+    weight = np.ones((trials, number_of_cells), dtype=np.float64)
+    finding = "finding" in policy
+    distance_aware = "distance" in policy
+    (cell_x, cell_y) = np.divmod(np.arange(number_of_cells), size)
+
+    searches = np.full(trials, -1, dtype=np.int64)
+    travel = np.zeros(trials, dtype=np.int64)
+    # Trial of each row of the arrays, and rows whose trial is finished
+    trial = np.arange(trials)
+    done = np.zeros(trials, dtype=bool)
+    step = 0
+
+    while len(trial) and (max_searches is None or step < max_searches):
+        step += 1
+        rows = np.arange(len(trial))
+        score = weight * (1 - false_negative) if finding else weight.copy()
+        if distance_aware:
+            (x, y) = np.divmod(position, size)
+            score /= 1 + np.abs(cell_x - x[:, None]) + np.abs(cell_y - y[:, None])
+        cell = score.argmax(axis=1)
+
+        (x, y) = np.divmod(position, size)
+        travel[trial] += np.where(done, 0, np.abs(cell // size - x) + np.abs(cell % size - y))
+        position = cell
+        false_negative_rate = false_negative[rows, cell]
+        found = (cell == target) & (generator.random(len(rows)) >= false_negative_rate) & ~done
+        weight[rows, cell] *= false_negative_rate
+
+        searches[trial[found]] = step
+        done |= found
+        if step % RESCALE_EVERY == 0:
+            largest = weight.max(axis=1)
+            small = largest < RESCALE_BELOW
+            weight[small] /= largest[small, None]
+
+        if done.mean() >= COMPACT_FRACTION:
+            keep = ~done
+            (weight, false_negative, target, position, trial) = (weight[keep], false_negative[keep], target[keep],
+                                                                 position[keep], trial[keep])
+            done = done[keep]
+
+    return searches, travel
+
+
+def run_policies(policies, size=DEFAULT_SIZE, trials=1000, seed=0, shards=None, workers=None, max_searches=None):
+    """
+    Run trials of every policy, split into shards over a process pool
+    Shard k of every policy gets the k-th seed spawned from seed, so all policies search the same trials.
+    :param policies: list of POLICIES
+    :param size: size of the landscapes
+    :param trials: number of trials per policy
+    :param seed: seed of the random generators
+    :param shards: number of shards per policy (default: number of workers of the pool)
+    :param workers: number of processes (default: number of CPUs)
+    :param max_searches: stop the trials that have not found their target after this many searches
+    :return: (dict) policy: {"searches": array, "travel": array}, trials in the same order for every policy
+    """
+    workers = workers or os.cpu_count()
+    shards = shards or workers
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        shard_trials = [len(chunk) for chunk in np.array_split(np.arange(trials), shards) if len(chunk)]
+        seeds = np.random.SeedSequence(seed).spawn(len(shard_trials))
+        futures = {policy: [executor.submit(simulate, policy, size, number, shard_seed, max_searches)
+                            for (number, shard_seed) in zip(shard_trials, seeds)] for policy in policies}
+        results = {}
+        for (policy, shard_futures) in futures.items():
+            shard_results = [future.result() for future in shard_futures]
+            results[policy] = {"searches": np.concatenate([searches for (searches, _) in shard_results]),
+                               "travel": np.concatenate([travel for (_, travel) in shard_results])}
+    return results
+
+
+def distribution(values):
+    """
+    :return: (dict) mean, standard deviation and percentiles of an array
+    """
+    if len(values) == 0:
+        return None
+    percentiles = np.percentile(values, [10, 50, 90, 99])
+    return {"mean": float(values.mean()), "std": float(values.std()), "min": int(values.min()),
+            "p10": float(percentiles[0]), "median": float(percentiles[1]), "p90": float(percentiles[2]),
+            "p99": float(percentiles[3]), "max": int(values.max())}
+
+
+def summarize(results):
+    """
+    Distributions of the searches, travel and actions (searches + moves) of the finished trials of each policy
+    :return: (dict) policy: summary
+    """
+    summaries = {}
+    for (policy, result) in results.items():
+        finished = result["searches"] >= 0
+        (searches, travel) = (result["searches"][finished], result["travel"][finished])
+        summaries[policy] = {"trials": len(finished), "finished": int(finished.sum()),
+                             "searches": distribution(searches), "travel": distribution(travel),
+                             "actions": distribution(searches + travel)}
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare search policies over many random landscapes")
+    parser.add_argument("--policy", nargs="+", choices=POLICIES, default=POLICIES)
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE)
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-searches", type=int, default=None)
+    parser.add_argument("--output", help="write the summaries to this JSON file")
+    parser.add_argument("--distributions", help="write the searches and travel of every trial to this .npz file")
+    args = parser.parse_args()
+
+    results = run_policies(args.policy, args.size, args.trials, args.seed, args.shards, args.workers,
+                           args.max_searches)
+    summaries = summarize(results)
+    for (policy, summary) in summaries.items():
+        if summary["searches"] is None:
+            # No trial finished, there is no distribution
+            print("%-20s finished %d/%d  searches N/A  travel N/A  actions N/A"
+                  % (policy, summary["finished"], summary["trials"]))
+            continue
+        print("%-20s finished %d/%d  searches %.1f (median %.0f)  travel %.1f  actions %.1f"
+              % (policy, summary["finished"], summary["trials"], summary["searches"]["mean"],
+                 summary["searches"]["median"], summary["travel"]["mean"], summary["actions"]["mean"]))
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(summaries, output, indent=2)
+    if args.distributions:
+        np.savez(args.distributions, **{policy.replace(" ", "_") + "_" + name: values
+                                        for (policy, result) in results.items() for (name, values) in result.items()})
+
+
+if __name__ == "__main__":
+    main()
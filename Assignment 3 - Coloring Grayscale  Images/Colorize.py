@@ -0,0 +1,149 @@
+# Colorize whole grayscale images with a model of the 3x3 patches of input.csv, a band of rows at a time so the
+# memory used does not grow with the image
+import os
+import tempfile
+import time
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+from TrainingData import load_training_data, PATCH_VALUES, COLOR_VALUES
+
+# Pixels colorized per tile, bounds the patch features (9 bytes per pixel) and the model output of a tile
+TILE_PIXELS = 2 ** 16
+# Weights of red, green and blue in the gray value of a pixel
+GRAY_WEIGHTS = numpy.array([0.21, 0.72, 0.07])
+
+
+class LinearColorModel:
+    def __init__(self, weights):
+        """
+        Color of a pixel as an affine function of its 3x3 patch
+        :param weights: (10 x 3) array, the last row is the bias
+        """
+        self.weights = numpy.asarray(weights, dtype=numpy.float64)
+
+    @classmethod
+    def fit(cls, patches, colors):
+        """
+        Least squares fit on training patches
+        :param patches: (N x 9) gray values
+        :param colors: (N x 3) RGB values
+        :return: model
+        """
+        features = numpy.hstack([numpy.asarray(patches, dtype=numpy.float64), numpy.ones((len(patches), 1))])
+        return cls(numpy.linalg.lstsq(features, numpy.asarray(colors, dtype=numpy.float64), rcond=None)[0])
+
+    def __call__(self, patches):
+        """
+        :param patches: (n x 9) gray values
+        :return: (n x 3) RGB values, not rounded or clipped
+        """
+        return patches @ self.weights[:-1] + self.weights[-1]
+
+
+def patch_windows(band):
+    """
+    View of the 3x3 patch of every pixel of a band of rows, flattened row by row like the rows of input.csv
+    :param band: (rows + 2 x width + 2) gray values, the band with one pixel of border around it
+    :return: (rows x width x 3 x 3) view of band, no value is copied
+    """
+    return sliding_window_view(band, (3, 3))
+
+
+def padded_band(gray, first_row, last_row):
+    """
+    Rows first_row to last_row of an image with a border of one pixel, repeating the edge pixels of the image
+    Only the band is copied, the image can be a memmap of any size.
+    :return: (last_row - first_row + 2 x width + 2) array
+    """
+    top = max(first_row - 1, 0)
+    bottom = min(last_row + 1, gray.shape[0])
+    return numpy.pad(numpy.asarray(gray[top:bottom]), ((top - (first_row - 1), last_row + 1 - bottom), (1, 1)),
+                     mode="edge")
+
+
+def open_output(output, shape):
+    """
+    :param output: None (new array), an array to write into, or the path of a .npy file to create as a memmap
+    :return: (height x width x 3) uint8 array
+    """
+    if output is None:
+        return numpy.empty(shape, dtype=numpy.uint8)
+    if isinstance(output, (str, os.PathLike)):
+        return numpy.lib.format.open_memmap(output, mode="w+", dtype=numpy.uint8, shape=shape)
+    if output.shape != shape or output.dtype != numpy.uint8:
+        raise ValueError("output must be a uint8 array of shape " + str(shape))
+    return output
+
+
+def colorize(gray, model, output=None, tile_pixels=TILE_PIXELS):
+    """
+    Color every pixel of a grayscale image from its 3x3 patch (edge pixels see the edge repeated)
+    The patches of a tile of rows are a strided view of the band of the image around it, copied into one feature
+    buffer reused by every tile, and the colors are written straight into the output.
+    :param gray: (height x width) gray values, array or memmap
+    :param model: function from (n x 9) uint8 patches to (n x 3) colors, e.g. LinearColorModel
+    :param output: None (new array), a (height x width x 3) uint8 array or memmap to fill, or the path of a .npy
+                   file to create
+    :param tile_pixels: pixels colorized at a time
+    :return: (height x width x 3) uint8 output
+    """
+    (height, width) = gray.shape
+    output = open_output(output, (height, width, COLOR_VALUES))
+    tile_rows = max(1, tile_pixels // width)
+    features = numpy.empty((tile_rows * width, PATCH_VALUES), dtype=numpy.uint8)
+
+    for first_row in range(0, height, tile_rows):
+        last_row = min(first_row + tile_rows, height)
+        pixels = (last_row - first_row) * width
+        tile = features[:pixels]
+        numpy.copyto(tile.reshape(last_row - first_row, width, 3, 3),
+                     patch_windows(padded_band(gray, first_row, last_row)))
+        colors = numpy.clip(numpy.rint(model(tile)), 0, 255)
+        output[first_row:last_row] = colors.reshape(last_row - first_row, width, COLOR_VALUES)
+
+    if isinstance(output, numpy.memmap):
+        output.flush()
+    return output
+
+
+def grayscale(image, output=None, tile_pixels=TILE_PIXELS):
+    """
+    Gray value of every pixel of an RGB image, a band of rows at a time
+    :param image: (height x width x 3) RGB values, array or memmap
+    :param output: None (new array) or a (height x width) uint8 array or memmap to fill
+    :param tile_pixels: pixels converted at a time
+    :return: (height x width) uint8 gray values
+    """
+    (height, width) = image.shape[:2]
+    output = numpy.empty((height, width), dtype=numpy.uint8) if output is None else output
+    tile_rows = max(1, tile_pixels // width)
+    for first_row in range(0, height, tile_rows):
+        band = numpy.asarray(image[first_row:first_row + tile_rows], dtype=numpy.float64)
+        output[first_row:first_row + tile_rows] = numpy.clip(numpy.rint(band @ GRAY_WEIGHTS), 0, 255)
+    return output
+
+
+if __name__ == "__main__":
+    import tracemalloc
+
+    model = LinearColorModel.fit(*load_training_data())
+
+    # A large synthetic image, colorized from a memmap into a memmap
+    directory = tempfile.mkdtemp()
+    size = 4000
+    gray = numpy.lib.format.open_memmap(os.path.join(directory, "gray.npy"), mode="w+", dtype=numpy.uint8,
+                                        shape=(size, size))
+    (x, y) = numpy.ogrid[:size, :size]
+    for first_row in range(0, size, 500):
+        gray[first_row:first_row + 500] = (128 + 100 * numpy.sin(x[first_row:first_row + 500] / 50)
+                                           * numpy.cos(y / 70)).astype(numpy.uint8)
+
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    colorize(gray, model, os.path.join(directory, "color.npy"))
+    elapsed = time.perf_counter() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    print("%dx%d image: %.2fs (%.1f Mpixels/s), peak memory %.1f MB for a %.1f MB output"
+          % (size, size, elapsed, size * size / elapsed / 1e6, peak / 2 ** 20, size * size * 3 / 2 ** 20))
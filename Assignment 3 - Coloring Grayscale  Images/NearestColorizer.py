@@ -0,0 +1,269 @@
+# Nearest neighbour colorizer: the color of a pixel is the mean color of the training patches closest to its 3x3
+# patch, found with a KD-tree over the 9 gray values that is built once and saved to disk
+import argparse
+import json
+import os
+import time
+
+import numpy
+
+from Colorize import colorize
+from TrainingData import load_training_data, training_checksums, DIRECTORY
+
+INDEX_VERSION = 1
+INDEX_FILE = "nearest.index.npz"
+LEAF_SIZE = 32
+# Queries answered at a time, bounds the (queries x candidates x 9) distance computation
+QUERY_BATCH = 2 ** 13
+
+
+def kmeans(values, clusters, iterations=20, seed=0):
+    """
+    Lloyd's algorithm
+    :param values: (N x d) array
+    :param clusters: number of clusters
+    :return: (clusters x d) centers
+    """
+    values = numpy.asarray(values, dtype=numpy.float64)
+    generator = numpy.random.default_rng(seed)
+    centers = values[generator.choice(len(values), size=clusters, replace=False)]
+    for _ in range(iterations):
+        nearest = ((values[:, None, :] - centers[None]) ** 2).sum(axis=2).argmin(axis=1)
+        counts = numpy.bincount(nearest, minlength=clusters)
+        sums = numpy.zeros_like(centers)
+        numpy.add.at(sums, nearest, values)
+        # Clusters that lost all their values keep their center
+        centers = numpy.where(counts[:, None] > 0, sums / numpy.maximum(counts, 1)[:, None], centers)
+    return centers
+
+
+class NearestColorizer:
+    def __init__(self, patches, colors, split_dimension, split_value, leaves, palette=None, checksums=None):
+        """
+        Use NearestColorizer.build or NearestColorizer.load
+        :param patches: (N x 9) training patches
+        :param colors: (N x 3) training colors
+        :param split_dimension: (nodes) value of the patch compared at each inner node of the tree
+        :param split_value: (nodes) patches with a smaller value go to the left child (2i + 1), others to the right
+        :param leaves: (leaves x capacity) indices of the patches of each leaf, -1 for unused places
+        :param palette: (clusters x 3) colors the results can be snapped to, None for no palette
+        :param checksums: (dict) checksums of the CSVs the patches were read from (see TrainingData), None if unknown
+        """
+        self.patches = numpy.asarray(patches, dtype=numpy.float32)
+        self.colors = numpy.asarray(colors, dtype=numpy.float32)
+        self.split_dimension = split_dimension
+        self.split_value = split_value
+        self.leaves = leaves
+        self.palette = palette
+        self.checksums = checksums
+        self.depth = int(numpy.log2(len(leaves)))
+        # A padding index reads this row, whose distance is infinite
+        self.padded_patches = numpy.vstack([self.patches, numpy.full((1, self.patches.shape[1]), numpy.inf,
+                                                                     dtype=numpy.float32)])
+
+    @classmethod
+    def build(cls, patches, colors, leaf_size=LEAF_SIZE, palette_size=None, checksums=None):
+        """
+        Build a balanced KD-tree, splitting every node at the median of its widest dimension
+        :param patches: (N x 9) training patches
+        :param colors: (N x 3) training colors
+        :param leaf_size: largest number of patches of a leaf
+        :param palette_size: number of colors of a k-means palette of the training colors (None for no palette)
+        :param checksums: (dict) checksums of the CSVs the patches were read from, saved with the index
+        :return: colorizer
+        """
+        patches = numpy.asarray(patches)
+        depth = max(0, int(numpy.ceil(numpy.log2(max(len(patches), 1) / leaf_size))))
+        split_dimension = numpy.zeros(2 ** depth - 1, dtype=numpy.int64)
+        split_value = numpy.zeros(2 ** depth - 1, dtype=numpy.float32)
+        order = numpy.arange(len(patches))
+        # Every level splits each node's range of order into two halves
+        bounds = [(0, len(patches))]
+        for level in range(depth):
+            next_bounds = []
+            for (offset, (first, last)) in enumerate(bounds):
+                node = 2 ** level - 1 + offset
+                members = order[first:last]
+                middle = 0
+                if len(members) > 1:
+                    values = patches[members]
+                    dimension = int((values.max(axis=0).astype(numpy.int64) - values.min(axis=0)).argmax())
+                    members[:] = members[numpy.argsort(values[:, dimension], kind="stable")]
+                    column = patches[members, dimension]
+                    # Split between two different values near the median when possible, so a patch equal to the
+                    # split value is on the right like the queries that look for it
+                    median = column[len(column) // 2]
+                    lower = numpy.searchsorted(column, median, "left")
+                    upper = numpy.searchsorted(column, median, "right")
+                    if lower == 0 or (upper < len(column) and upper - len(column) // 2 < len(column) // 2 - lower):
+                        middle = upper
+                    else:
+                        middle = lower
+                    if not len(column) // 4 <= middle <= len(column) - len(column) // 4:
+                        # Too many patches equal to the median, split them so the leaves stay small
+                        middle = len(column) // 2
+                    split_dimension[node] = dimension
+                    split_value[node] = column[middle]
+                next_bounds += [(first, first + middle), (first + middle, last)]
+            bounds = next_bounds
+
+        capacity = max(last - first for (first, last) in bounds)
+        leaves = numpy.full((len(bounds), capacity), len(patches), dtype=numpy.int64)
+        for (leaf, (first, last)) in enumerate(bounds):
+            leaves[leaf, :last - first] = order[first:last]
+
+        palette = kmeans(colors, palette_size) if palette_size else None
+        return cls(patches, colors, split_dimension, split_value, leaves, palette, checksums)
+
+    def descend(self, queries, nodes, first_level):
+        """
+        Follow the tree from given nodes down to the leaves
+        :param queries: (B x 9) patches
+        :param nodes: (B) node of every query
+        :param first_level: (B) level of the node of every query
+        :return: leaves of the queries and |query - split value| at every level (infinite above first_level)
+        """
+        rows = numpy.arange(len(queries))
+        margins = numpy.full((len(queries), self.depth), numpy.inf, dtype=numpy.float32)
+        for level in range(self.depth):
+            moving = first_level <= level
+            # Queries that are not moving yet may be on a leaf already, look them up at any inner node
+            inner = numpy.where(moving, nodes, 0)
+            difference = queries[rows, self.split_dimension[inner]] - self.split_value[inner]
+            children = 2 * nodes + 1 + (difference >= 0)
+            nodes = numpy.where(moving, children, nodes)
+            margins[:, level] = numpy.where(moving, numpy.abs(difference), numpy.inf)
+        return nodes - (2 ** self.depth - 1), margins
+
+    def candidate_leaves(self, queries, probes):
+        """
+        Leaf of every query, and probes - 1 more leaves: the other side of the splits the query was closest to
+        :return: (B x probes) leaves
+        """
+        (leaf, margins) = self.descend(queries, numpy.zeros(len(queries), dtype=numpy.int64),
+                                       numpy.zeros(len(queries), dtype=numpy.int64))
+        leaves = [leaf]
+        if probes > 1 and self.depth:
+            path = leaf + 2 ** self.depth - 1
+            for level in numpy.argsort(margins, axis=1)[:, :probes - 1].T:
+                # Child the path took at the split of that level, then the other child (left children are odd)
+                node = (path + 1) // 2 ** (self.depth - level - 1) - 1
+                sibling = node + numpy.where(node % 2 == 1, 1, -1)
+                leaves.append(self.descend(queries, sibling, level + 1)[0])
+        return numpy.stack(leaves, axis=1)
+
+    def query(self, queries, k=5, probes=4):
+        """
+        Approximate k nearest training patches of a batch of patches (exact within the probed leaves)
+        :param queries: (B x 9) patches
+        :param k: number of neighbors
+        :param probes: number of leaves searched per query, more is slower and closer to exact
+        :return: (B x k) indices of the training patches and (B x k) squared distances, nearest first
+        """
+        queries = numpy.asarray(queries, dtype=numpy.float32)
+        candidates = self.leaves[self.candidate_leaves(queries, probes)].reshape(len(queries), -1)
+        distances = ((self.padded_patches[candidates] - queries[:, None, :]) ** 2).sum(axis=2)
+        k = min(k, candidates.shape[1])
+        nearest = numpy.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = numpy.take_along_axis(distances, nearest, axis=1)
+        order = numpy.argsort(nearest_distances, axis=1)
+        return (numpy.take_along_axis(candidates, numpy.take_along_axis(nearest, order, axis=1), axis=1),
+                numpy.take_along_axis(nearest_distances, order, axis=1))
+
+    def predict(self, patches, k=5, probes=4, snap=False):
+        """
+        Mean color of the nearest training patches of every patch
+        :param patches: (n x 9) patches
+        :param k: number of neighbors
+        :param probes: number of leaves searched per patch
+        :param snap: replace every color by the closest color of the palette
+        :return: (n x 3) colors
+        """
+        colors = numpy.empty((len(patches), 3), dtype=numpy.float32)
+        for first in range(0, len(patches), QUERY_BATCH):
+            (neighbors, distances) = self.query(patches[first:first + QUERY_BATCH], k, probes)
+            # Neighbors beyond the probed leaves are padding with infinite distance, leave them out
+            found = numpy.isfinite(distances)
+            colors_sum = (self.colors[numpy.where(found, neighbors, 0)] * found[:, :, None]).sum(axis=1)
+            colors[first:first + QUERY_BATCH] = colors_sum / numpy.maximum(found.sum(axis=1), 1)[:, None]
+        if snap:
+            if self.palette is None:
+                raise ValueError("the colorizer was built without a palette")
+            colors = self.palette[((colors[:, None, :] - self.palette[None]) ** 2).sum(axis=2).argmin(axis=1)]
+        return colors
+
+    def model(self, k=5, probes=4, snap=False):
+        """
+        :return: function from (n x 9) patches to (n x 3) colors, for Colorize.colorize
+        """
+        return lambda patches: self.predict(patches, k, probes, snap)
+
+    def colorize(self, gray, output=None, k=5, probes=4, snap=False):
+        """
+        Colorize a whole grayscale image (see Colorize.colorize)
+        :return: (height x width x 3) uint8 colors and the throughput in pixels per second
+        """
+        start_time = time.perf_counter()
+        output = colorize(gray, self.model(k, probes, snap), output)
+        return output, gray.size / (time.perf_counter() - start_time)
+
+    def save(self, path):
+        numpy.savez(path, version=INDEX_VERSION, patches=self.patches, colors=self.colors,
+                    split_dimension=self.split_dimension, split_value=self.split_value, leaves=self.leaves,
+                    palette=self.palette if self.palette is not None else numpy.empty((0, 3)),
+                    checksums=json.dumps(self.checksums))
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as index:
+            if int(index["version"]) != INDEX_VERSION:
+                raise ValueError("%s has version %d, expected %d" % (path, int(index["version"]), INDEX_VERSION))
+            palette = index["palette"] if len(index["palette"]) else None
+            # Indices saved before the checksums were stored have none
+            checksums = json.loads(str(index["checksums"])) if "checksums" in index.files else None
+            return cls(index["patches"], index["colors"], index["split_dimension"], index["split_value"],
+                       index["leaves"], palette, checksums)
+
+    @classmethod
+    def open(cls, path=os.path.join(DIRECTORY, INDEX_FILE), leaf_size=LEAF_SIZE, palette_size=16):
+        """
+        Load the index of the training set, building and saving it the first time and again whenever input.csv or
+        color.csv changed since it was built
+        """
+        checksums = training_checksums()
+        if os.path.exists(path):
+            colorizer = cls.load(path)
+            if colorizer.checksums == checksums:
+                return colorizer
+        colorizer = cls.build(*load_training_data(), leaf_size=leaf_size, palette_size=palette_size,
+                              checksums=checksums)
+        colorizer.save(path)
+        return colorizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Colorize a grayscale image with nearest training patches")
+    parser.add_argument("--index", default=os.path.join(DIRECTORY, INDEX_FILE))
+    parser.add_argument("--image", help=".npy file of a (height x width) uint8 grayscale image")
+    parser.add_argument("--size", type=int, default=1000, help="size of the synthetic image used without --image")
+    parser.add_argument("--output", help=".npy file to write the colors to")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--probes", type=int, default=4)
+    parser.add_argument("--snap", action="store_true", help="snap the colors to the k-means palette")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    colorizer = NearestColorizer.open(args.index)
+    print("Index of %d patches ready in %.3fs" % (len(colorizer.patches), time.perf_counter() - start_time))
+
+    if args.image:
+        gray = numpy.load(args.image, mmap_mode="r")
+    else:
+        (x, y) = numpy.ogrid[:args.size, :args.size]
+        gray = (128 + 100 * numpy.sin(x / 50) * numpy.cos(y / 70)).astype(numpy.uint8)
+    (_, pixels_per_second) = colorizer.colorize(gray, args.output, args.k, args.probes, args.snap)
+    print("%dx%d image: %.0f pixels/s" % (gray.shape[0], gray.shape[1], pixels_per_second))
+
+
+if __name__ == "__main__":
+    main()
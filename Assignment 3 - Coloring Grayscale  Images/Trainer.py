@@ -0,0 +1,377 @@
+# Train a linear model or a small MLP from the 9 gray values of a patch to the RGB color of its center pixel, with
+# mini-batch SGD or Adam in NumPy. Batches are streamed from the memory mapped training data by a prefetch thread
+# into preallocated buffers, and the training step reuses preallocated arrays, so nothing is allocated per step.
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+import numpy
+
+from TrainingData import load_training_data, DIRECTORY, PATCH_VALUES, COLOR_VALUES
+
+# Rows read together when shuffling, whole blocks are shuffled so the reads of a batch stay local on disk
+SHUFFLE_BLOCK = 4096
+CHANNELS = ["red", "green", "blue"]
+
+
+class BatchLoader:
+    def __init__(self, patches, colors, batch_size, seed=None, prefetch=2, block_size=SHUFFLE_BLOCK):
+        """
+        Shuffled mini-batches of (patches / 255, colors / 255), filled by a background thread
+        Every epoch takes the blocks of rows in a random order and the rows of every block in a random order.
+        prefetch + 1 pairs of buffers are allocated once and cycled.
+        :param patches: (N x 9) uint8 array or memmap
+        :param colors: (N x 3) uint8 array or memmap
+        :param batch_size: rows per batch
+        :param seed: seed of the shuffling
+        :param prefetch: number of batches prepared ahead of the training step
+        :param block_size: rows per shuffled block
+        """
+        self.patches = patches
+        self.colors = colors
+        self.batch_size = batch_size
+        self.generator = numpy.random.default_rng(seed)
+        self.block_size = block_size
+        number_of_buffers = prefetch + 1
+        self.raw_inputs = numpy.empty((number_of_buffers, batch_size, PATCH_VALUES), dtype=numpy.uint8)
+        self.raw_targets = numpy.empty((number_of_buffers, batch_size, COLOR_VALUES), dtype=numpy.uint8)
+        self.inputs = numpy.empty((number_of_buffers, batch_size, PATCH_VALUES), dtype=numpy.float32)
+        self.targets = numpy.empty((number_of_buffers, batch_size, COLOR_VALUES), dtype=numpy.float32)
+        self.order = numpy.arange(len(patches))
+
+    def shuffle(self):
+        """
+        Shuffle the order of the rows: blocks in random order, then the rows inside every block
+        """
+        blocks = numpy.arange(0, len(self.order), self.block_size)
+        self.generator.shuffle(blocks)
+        self.order = numpy.concatenate([numpy.arange(first, min(first + self.block_size, len(self.order)))
+                                        for first in blocks])
+        for first in range(0, len(self.order), self.block_size):
+            self.generator.shuffle(self.order[first:first + self.block_size])
+
+    def fill(self, buffer, rows):
+        """
+        Gather rows into a pair of buffers and scale them to 0 - 1, without allocating
+        """
+        count = len(rows)
+        # Reading rows in increasing order is sequential on disk, the order inside the batch does not matter
+        rows.sort()
+        numpy.take(self.patches, rows, axis=0, out=self.raw_inputs[buffer, :count])
+        numpy.take(self.colors, rows, axis=0, out=self.raw_targets[buffer, :count])
+        numpy.multiply(self.raw_inputs[buffer, :count], 1 / 255, out=self.inputs[buffer, :count])
+        numpy.multiply(self.raw_targets[buffer, :count], 1 / 255, out=self.targets[buffer, :count])
+
+    def epoch(self):
+        """
+        One pass over the shuffled data
+        A yielded batch is a view of a buffer that is only refilled after the next batch is requested.
+        :return: generator of (inputs, targets) float32 arrays, batch_size rows (fewer for the last batch)
+        """
+        self.shuffle()
+        # Copy of the batches' rows, the order is not changed under the thread
+        batches = [self.order[first:first + self.batch_size].copy()
+                   for first in range(0, len(self.order), self.batch_size)]
+        free = queue.Queue()
+        ready = queue.Queue()
+        for buffer in range(len(self.inputs)):
+            free.put(buffer)
+        stop = threading.Event()
+
+        def prefetch():
+            for rows in batches:
+                buffer = free.get()
+                if stop.is_set():
+                    return
+                self.fill(buffer, rows)
+                ready.put((buffer, len(rows)))
+            ready.put(None)
+
+        thread = threading.Thread(target=prefetch, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    break
+                (buffer, count) = item
+                yield self.inputs[buffer, :count], self.targets[buffer, :count]
+                free.put(buffer)
+        finally:
+            # The training loop may stop early, let the thread exit
+            stop.set()
+            free.put(0)
+            thread.join()
+
+
+class ColorModel:
+    def __init__(self, hidden=(32,), seed=None):
+        """
+        Fully connected network from the 9 gray values of a patch (scaled to 0 - 1) to the RGB color (0 - 1), ReLU
+        on the hidden layers, no hidden layer for a linear model
+        :param hidden: sizes of the hidden layers
+        :param seed: seed of the initial weights
+        """
+        generator = numpy.random.default_rng(seed)
+        sizes = [PATCH_VALUES] + list(hidden) + [COLOR_VALUES]
+        self.weights = [(generator.standard_normal((fan_in, fan_out)) * numpy.sqrt(2 / fan_in)).astype(numpy.float32)
+                        for (fan_in, fan_out) in zip(sizes[:-1], sizes[1:])]
+        self.biases = [numpy.zeros(fan_out, dtype=numpy.float32) for fan_out in sizes[1:]]
+        self.batch_size = None
+
+    @property
+    def parameters(self):
+        return self.weights + self.biases
+
+    def allocate(self, batch_size):
+        """
+        Buffers of the forward and backward passes of up to batch_size rows, reused by every step
+        """
+        if self.batch_size == batch_size:
+            return
+        self.batch_size = batch_size
+        self.activations = [numpy.empty((batch_size, weight.shape[1]), dtype=numpy.float32) for weight in self.weights]
+        self.deltas = [numpy.empty_like(activation) for activation in self.activations]
+        self.active = [numpy.empty(activation.shape, dtype=bool) for activation in self.activations]
+        self.gradients = [numpy.empty_like(parameter) for parameter in self.parameters]
+        self.errors = numpy.empty((batch_size, COLOR_VALUES), dtype=numpy.float32)
+        self.squared_errors = numpy.empty(COLOR_VALUES, dtype=numpy.float64)
+
+    def forward(self, inputs):
+        """
+        :param inputs: (n x 9) float32, n <= the allocated batch size
+        :return: (n x 3) output, a view of a buffer overwritten by the next pass
+        """
+        count = len(inputs)
+        layer_input = inputs
+        for (layer, (weight, bias)) in enumerate(zip(self.weights, self.biases)):
+            output = self.activations[layer][:count]
+            numpy.matmul(layer_input, weight, out=output)
+            output += bias
+            if layer < len(self.weights) - 1:
+                numpy.maximum(output, 0, out=output)
+            layer_input = output
+        return layer_input
+
+    def step(self, inputs, targets):
+        """
+        Forward and backward pass of the mean squared error of a batch, into self.gradients
+        :return: (3) sum over the batch of the squared error of every channel
+        """
+        count = len(inputs)
+        outputs = self.forward(inputs)
+        errors = self.errors[:count]
+        numpy.subtract(outputs, targets, out=errors)
+        numpy.einsum("ij,ij->j", errors, errors, out=self.squared_errors)
+
+        layers = len(self.weights)
+        delta = self.deltas[-1][:count]
+        numpy.multiply(errors, 2 / (count * COLOR_VALUES), out=delta)
+        for layer in range(layers - 1, -1, -1):
+            layer_input = inputs if layer == 0 else self.activations[layer - 1][:count]
+            numpy.matmul(layer_input.T, delta, out=self.gradients[layer])
+            numpy.sum(delta, axis=0, out=self.gradients[layers + layer])
+            if layer > 0:
+                previous = self.deltas[layer - 1][:count]
+                numpy.matmul(delta, self.weights[layer].T, out=previous)
+                # Derivative of ReLU
+                active = self.active[layer - 1][:count]
+                numpy.greater(layer_input, 0, out=active)
+                previous *= active
+                delta = previous
+        return self.squared_errors
+
+    def __call__(self, patches):
+        """
+        :param patches: (n x 9) gray values 0 - 255
+        :return: (n x 3) colors 0 - 255, for Colorize.colorize
+        """
+        outputs = numpy.asarray(patches, dtype=numpy.float32) / 255
+        for (layer, (weight, bias)) in enumerate(zip(self.weights, self.biases)):
+            outputs = outputs @ weight + bias
+            if layer < len(self.weights) - 1:
+                outputs = numpy.maximum(outputs, 0)
+        return outputs * 255
+
+
+class Adam:
+    def __init__(self, parameters, learning_rate=1e-3, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        self.parameters = parameters
+        self.learning_rate = learning_rate
+        (self.beta1, self.beta2, self.epsilon) = (beta1, beta2, epsilon)
+        self.first_moments = [numpy.zeros_like(parameter) for parameter in parameters]
+        self.second_moments = [numpy.zeros_like(parameter) for parameter in parameters]
+        self.scratch = [numpy.empty_like(parameter) for parameter in parameters]
+        self.steps = 0
+
+    @property
+    def state(self):
+        return self.first_moments + self.second_moments
+
+    def update(self, gradients):
+        self.steps += 1
+        step_size = self.learning_rate * numpy.sqrt(1 - self.beta2 ** self.steps) / (1 - self.beta1 ** self.steps)
+        for (parameter, gradient, first, second, scratch) in zip(self.parameters, gradients, self.first_moments,
+                                                                 self.second_moments, self.scratch):
+            first *= self.beta1
+            numpy.multiply(gradient, 1 - self.beta1, out=scratch)
+            first += scratch
+            second *= self.beta2
+            numpy.multiply(gradient, gradient, out=scratch)
+            scratch *= 1 - self.beta2
+            second += scratch
+            numpy.sqrt(second, out=scratch)
+            scratch += self.epsilon
+            numpy.divide(first, scratch, out=scratch)
+            scratch *= step_size
+            parameter -= scratch
+
+
+class SGD:
+    def __init__(self, parameters, learning_rate=1e-2, momentum=0.9):
+        self.parameters = parameters
+        self.learning_rate = learning_rate
+        self.momentum = momentum
+        self.velocities = [numpy.zeros_like(parameter) for parameter in parameters]
+        self.scratch = [numpy.empty_like(parameter) for parameter in parameters]
+        self.steps = 0
+
+    @property
+    def state(self):
+        return self.velocities
+
+    def update(self, gradients):
+        self.steps += 1
+        for (parameter, gradient, velocity, scratch) in zip(self.parameters, gradients, self.velocities,
+                                                            self.scratch):
+            velocity *= self.momentum
+            numpy.multiply(gradient, self.learning_rate, out=scratch)
+            velocity -= scratch
+            parameter += velocity
+
+
+OPTIMIZERS = {"adam": Adam, "sgd": SGD}
+
+
+def save_checkpoint(path, model, optimizer, epoch, history):
+    """
+    Save the weights, the optimizer state and the history, replacing the previous checkpoint atomically
+    """
+    arrays = {"parameter_%d" % i: parameter for (i, parameter) in enumerate(model.parameters)}
+    arrays.update({"state_%d" % i: state for (i, state) in enumerate(optimizer.state)})
+    # numpy.savez adds .npz to names without it
+    temporary_path = path + ".tmp.npz"
+    numpy.savez(temporary_path, steps=optimizer.steps, epoch=epoch, history=json.dumps(history), **arrays)
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path, model, optimizer):
+    """
+    Restore the weights and the optimizer state in place
+    :return: epoch reached and history
+    """
+    with numpy.load(path) as checkpoint:
+        for (i, parameter) in enumerate(model.parameters):
+            parameter[...] = checkpoint["parameter_%d" % i]
+        for (i, state) in enumerate(optimizer.state):
+            state[...] = checkpoint["state_%d" % i]
+        optimizer.steps = int(checkpoint["steps"])
+        return int(checkpoint["epoch"]), json.loads(str(checkpoint["history"]))
+
+
+def evaluate(model, patches, colors, batch_size=2 ** 14):
+    """
+    :return: root mean squared error of every channel, in 0 - 255 units
+    """
+    squared_errors = numpy.zeros(COLOR_VALUES)
+    for first in range(0, len(patches), batch_size):
+        errors = model(patches[first:first + batch_size]) - colors[first:first + batch_size]
+        squared_errors += (errors.astype(numpy.float64) ** 2).sum(axis=0)
+    return numpy.sqrt(squared_errors / max(len(patches), 1))
+
+
+def train(model, optimizer, patches, colors, epochs, batch_size=256, validation_fraction=0.1, seed=None,
+          checkpoint_path=None, checkpoint_every=1, prefetch=2, log=print):
+    """
+    Train a model, holding the last rows of the data out for validation
+    :param model: ColorModel
+    :param optimizer: Adam or SGD of the model's parameters
+    :param patches: (N x 9) uint8 array or memmap
+    :param colors: (N x 3) uint8 array or memmap
+    :param epochs: number of passes over the training rows
+    :param batch_size: rows per step
+    :param validation_fraction: fraction of the rows held out
+    :param seed: seed of the shuffling
+    :param checkpoint_path: .npz file saved every checkpoint_every epochs, and resumed from if it exists
+    :param checkpoint_every: epochs between checkpoints
+    :param prefetch: batches prepared ahead by the loader thread
+    :param log: function called with a line per epoch (None for silence)
+    :return: history, a dict per epoch with the training and validation RMSE of every channel and samples/s
+    """
+    split = len(patches) - int(len(patches) * validation_fraction)
+    loader = BatchLoader(patches[:split], colors[:split], batch_size, seed, prefetch)
+    model.allocate(batch_size)
+    (first_epoch, history) = (0, [])
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        (first_epoch, history) = load_checkpoint(checkpoint_path, model, optimizer)
+
+    squared_errors = numpy.zeros(COLOR_VALUES)
+    for epoch in range(first_epoch, epochs):
+        squared_errors[:] = 0
+        start_time = time.perf_counter()
+        for (inputs, targets) in loader.epoch():
+            squared_errors += model.step(inputs, targets)
+            optimizer.update(model.gradients)
+        elapsed = time.perf_counter() - start_time
+
+        record = {"epoch": epoch + 1, "samples per second": split / elapsed,
+                  "training rmse": (numpy.sqrt(squared_errors / split) * 255).tolist(),
+                  "validation rmse": evaluate(model, patches[split:], colors[split:]).tolist()}
+        history.append(record)
+        if log is not None:
+            log("epoch %3d  %9.0f samples/s  training rmse %s  validation rmse %s"
+                % (record["epoch"], record["samples per second"], describe(record["training rmse"]),
+                   describe(record["validation rmse"])))
+        if checkpoint_path is not None and ((epoch + 1) % checkpoint_every == 0 or epoch + 1 == epochs):
+            save_checkpoint(checkpoint_path, model, optimizer, epoch + 1, history)
+    return history
+
+
+def describe(rmse):
+    return " ".join("%s %6.2f" % (channel[0].upper(), value) for (channel, value) in zip(CHANNELS, rmse))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a gray patch to color model and report its throughput")
+    parser.add_argument("--directory", default=DIRECTORY, help="directory of input.csv and color.csv")
+    parser.add_argument("--hidden", type=int, nargs="*", default=[32], help="hidden layer sizes, none for linear")
+    parser.add_argument("--optimizer", choices=list(OPTIMIZERS), default="adam")
+    parser.add_argument("--learning-rate", type=float, default=None)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--prefetch", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint", help=".npz checkpoint, resumed from if it exists")
+    parser.add_argument("--checkpoint-every", type=int, default=1)
+    parser.add_argument("--history", help="write the loss and throughput of every epoch to this JSON file")
+    args = parser.parse_args()
+
+    (patches, colors) = load_training_data(args.directory)
+    model = ColorModel(args.hidden, args.seed)
+    options = {} if args.learning_rate is None else {"learning_rate": args.learning_rate}
+    optimizer = OPTIMIZERS[args.optimizer](model.parameters, **options)
+    history = train(model, optimizer, patches, colors, args.epochs, args.batch_size, seed=args.seed,
+                    checkpoint_path=args.checkpoint, checkpoint_every=args.checkpoint_every, prefetch=args.prefetch)
+
+    if history:
+        print("mean throughput %.0f samples/s" % numpy.mean([record["samples per second"] for record in history]))
+    if args.history:
+        with open(args.history, "w") as history_file:
+            json.dump(history, history_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
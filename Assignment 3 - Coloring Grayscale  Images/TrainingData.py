@@ -0,0 +1,186 @@
+# Training data of the colorization model: 3x3 grayscale patches (input.csv) and the RGB color of their center
+# pixel (color.csv), converted once from CSV to .npy files that later runs map into memory without parsing
+#
+# Every CSV gets a cache <name>.cache.npy (uint8, one row per CSV line) and <name>.cache.json describing it:
+# cache version, checksum, size and modification time of the CSV, and the shape of the array.
+import hashlib
+import itertools
+import json
+import os
+import time
+
+import numpy
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+INPUT_FILE = "input.csv"
+COLOR_FILE = "color.csv"
+PATCH_VALUES = 9
+COLOR_VALUES = 3
+CACHE_VERSION = 1
+# Rows parsed at a time, bounds the memory used to convert a CSV of any size
+CHUNK_ROWS = 2 ** 16
+HASH_BLOCK = 2 ** 20
+
+
+def scan_csv(path):
+    """
+    Read a CSV once as bytes, without parsing it
+    :return: sha256 hex digest and number of rows
+    """
+    digest = hashlib.sha256()
+    rows = 0
+    last_byte = b"\n"
+    with open(path, "rb") as csv_file:
+        for block in iter(lambda: csv_file.read(HASH_BLOCK), b""):
+            digest.update(block)
+            rows += block.count(b"\n")
+            last_byte = block[-1:]
+    # The last line may have no line break
+    return digest.hexdigest(), rows + (last_byte != b"\n")
+
+
+def iterate_csv(path, columns, chunk_rows=CHUNK_ROWS):
+    """
+    Stream a CSV of integers 0 - 255, chunk_rows rows at a time
+    :param path: path of the CSV
+    :param columns: number of values per row
+    :param chunk_rows: number of rows per chunk
+    :return: generator of (rows x columns) uint8 arrays
+    """
+    with open(path) as csv_file:
+        while True:
+            lines = list(itertools.islice(csv_file, chunk_rows))
+            if not lines:
+                return
+            chunk = numpy.loadtxt(lines, delimiter=",", dtype=numpy.int16, ndmin=2)
+            if chunk.shape[1] != columns:
+                raise ValueError("%s has %d values per row, expected %d" % (path, chunk.shape[1], columns))
+            if chunk.min() < 0 or chunk.max() > 255:
+                raise ValueError(path + " has values out of range 0 - 255")
+            yield chunk.astype(numpy.uint8)
+
+
+def cache_paths(csv_path, cache_directory=None):
+    """
+    :return: paths of the .npy and .json files of the cache of a CSV
+    """
+    directory = cache_directory or os.path.dirname(os.path.abspath(csv_path))
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(directory, name + ".cache.npy"), os.path.join(directory, name + ".cache.json")
+
+
+def write_metadata(metadata_path, metadata):
+    """
+    Write the metadata of a cache to a temporary file and rename it, so it is never left half written
+    """
+    with open(metadata_path + ".tmp", "w") as metadata_file:
+        json.dump(metadata, metadata_file, indent=2)
+    os.replace(metadata_path + ".tmp", metadata_path)
+
+
+def convert_csv(csv_path, columns, cache_directory=None, chunk_rows=CHUNK_ROWS):
+    """
+    Convert a CSV into its cache, streaming it so it never has to fit in memory
+    :return: (numpy memmap) read only view of the cache
+    """
+    (array_path, metadata_path) = cache_paths(csv_path, cache_directory)
+    os.makedirs(os.path.dirname(array_path), exist_ok=True)
+    status = os.stat(csv_path)
+    (checksum, rows) = scan_csv(csv_path)
+
+    # Fill a temporary file and rename it, an interrupted conversion never leaves a partial cache behind
+    temporary_path = array_path + ".tmp.npy"
+    array = numpy.lib.format.open_memmap(temporary_path, mode="w+", dtype=numpy.uint8, shape=(rows, columns))
+    try:
+        filled = 0
+        for chunk in iterate_csv(csv_path, columns, chunk_rows):
+            array[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+        if filled != rows:
+            raise ValueError("%s has %d rows with values out of %d lines" % (csv_path, filled, rows))
+        array.flush()
+    except BaseException:
+        del array
+        os.remove(temporary_path)
+        raise
+    del array
+    os.replace(temporary_path, array_path)
+
+    metadata = {"version": CACHE_VERSION, "source": os.path.basename(csv_path), "sha256": checksum,
+                "bytes": status.st_size, "mtime_ns": status.st_mtime_ns, "shape": [rows, columns]}
+    write_metadata(metadata_path, metadata)
+    return numpy.load(array_path, mmap_mode="r")
+
+
+def load_csv(csv_path, columns, cache_directory=None, chunk_rows=CHUNK_ROWS):
+    """
+    Load a CSV of integers 0 - 255 through its cache, converting it if the cache is missing or out of date
+    The cache is trusted without reading the CSV when its size and modification time did not change. Otherwise
+    the checksum decides: a CSV that was only touched keeps its cache.
+    :param csv_path: path of the CSV
+    :param columns: number of values per row
+    :param cache_directory: directory of the cache (default: the directory of the CSV)
+    :param chunk_rows: number of rows parsed at a time when converting
+    :return: (numpy memmap) read only (rows x columns) uint8 view of the cache
+    """
+    (array_path, metadata_path) = cache_paths(csv_path, cache_directory)
+    try:
+        with open(metadata_path) as metadata_file:
+            metadata = json.load(metadata_file)
+    except (OSError, ValueError):
+        return convert_csv(csv_path, columns, cache_directory, chunk_rows)
+
+    status = os.stat(csv_path)
+    if metadata.get("version") != CACHE_VERSION or metadata.get("shape", [None, None])[1] != columns \
+            or not os.path.exists(array_path):
+        return convert_csv(csv_path, columns, cache_directory, chunk_rows)
+    if (metadata["bytes"], metadata["mtime_ns"]) != (status.st_size, status.st_mtime_ns):
+        if scan_csv(csv_path)[0] != metadata["sha256"]:
+            return convert_csv(csv_path, columns, cache_directory, chunk_rows)
+        metadata["mtime_ns"] = status.st_mtime_ns
+        write_metadata(metadata_path, metadata)
+
+    array = numpy.load(array_path, mmap_mode="r")
+    if list(array.shape) != metadata["shape"]:
+        return convert_csv(csv_path, columns, cache_directory, chunk_rows)
+    return array
+
+
+def load_training_data(directory=DIRECTORY, cache_directory=None, chunk_rows=CHUNK_ROWS):
+    """
+    Load the training set, from the caches after the first time
+    :param directory: directory of input.csv and color.csv
+    :param cache_directory: directory of the caches (default: directory)
+    :param chunk_rows: number of rows parsed at a time when converting
+    :return: (N x 9) uint8 patches and (N x 3) uint8 colors, read only memmaps
+    """
+    patches = load_csv(os.path.join(directory, INPUT_FILE), PATCH_VALUES, cache_directory, chunk_rows)
+    colors = load_csv(os.path.join(directory, COLOR_FILE), COLOR_VALUES, cache_directory, chunk_rows)
+    if len(patches) != len(colors):
+        raise ValueError("%s has %d rows but %s has %d" % (INPUT_FILE, len(patches), COLOR_FILE, len(colors)))
+    return patches, colors
+
+
+def training_checksums(directory=DIRECTORY, cache_directory=None):
+    """
+    Checksums of input.csv and color.csv, read from the metadata of their caches (brought up to date first)
+    :return: (dict) CSV file name: sha256 hex digest
+    """
+    load_training_data(directory, cache_directory)
+    checksums = {}
+    for name in [INPUT_FILE, COLOR_FILE]:
+        with open(cache_paths(os.path.join(directory, name), cache_directory)[1]) as metadata_file:
+            checksums[name] = json.load(metadata_file)["sha256"]
+    return checksums
+
+
+if __name__ == "__main__":
+    start_time = time.perf_counter()
+    numpy.loadtxt(os.path.join(DIRECTORY, INPUT_FILE), delimiter=",", dtype=numpy.uint8)
+    numpy.loadtxt(os.path.join(DIRECTORY, COLOR_FILE), delimiter=",", dtype=numpy.uint8)
+    print("Parsing the CSVs: %.3fs" % (time.perf_counter() - start_time))
+
+    for attempt in ["First load (converts if needed)", "Cached load"]:
+        start_time = time.perf_counter()
+        (patches, colors) = load_training_data()
+        print("%s: %.4fs, %d patches" % (attempt, time.perf_counter() - start_time, len(patches)))